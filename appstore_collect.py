@@ -24,16 +24,29 @@ Usage:
 """
 
 import argparse
+import contextlib
 import csv
-import json
+import hashlib
 import os
+import queue
+import shutil
+import sqlite3
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+from itunes_cache import DEFAULT_CACHE_DIR, JsonCache, dumps_json, loads_json
 
 ITUNES_LOOKUP = "https://itunes.apple.com/lookup"
 REVIEWS_RSS = "https://itunes.apple.com/{country}/rss/customerreviews/id={track_id}/sortby=mostrecent/json"
@@ -42,11 +55,198 @@ DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; AppCollector/1.1)"
 }
 
+# Session はスレッドセーフではないので、ワーカースレッドごとに1つ持たせる
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 32
+# 429/5xx は urllib3 側で指数バックオフ（1,2,4,8…秒）しつつ再試行。Retry-After があればそれに従う
+RETRY_TOTAL = 8
+RETRY_BACKOFF = 1.0
+RETRY_STATUS = [429, 500, 502, 503, 504]
+_tls = threading.local()
+
+def make_session() -> requests.Session:
+    """keep-alive 接続をプールする Session（TCP/TLS ハンドシェイクを毎回やり直さない）"""
+    session = requests.Session()
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        respect_retry_after_header=True,
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+def get_session() -> requests.Session:
+    """ワーカースレッドごとに1つの Session を作って使い回す"""
+    session = getattr(_tls, "session", None)
+    if session is None:
+        session = _tls.session = make_session()
+    return session
+
+# 適応型レート制御: 2xx が続けば少しずつ速く、429 が来たら半分に落とす（ホスト×エンドポイントごと）
+RATE_MIN = 0.05          # req/s の下限
+RATE_MAX_FACTOR = 4.0    # 初期レートの何倍まで上げるか
+RATE_INCREASE = 1.1
+RATE_SUCCESS_STREAK = 10 # この回数だけ 2xx が連続したら加速
+BUCKET_CAPACITY = 2.0
+
+class TokenBucket:
+    """スレッド間で共有するトークンバケット。acquire() で1リクエスト分のトークンを待つ"""
+    def __init__(self, rate: float, capacity: float = BUCKET_CAPACITY):
+        self.rate = rate
+        self.max_rate = rate * RATE_MAX_FACTOR
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.streak = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.streak += 1
+            if self.streak >= RATE_SUCCESS_STREAK:
+                self.rate = min(self.max_rate, self.rate * RATE_INCREASE)
+                self.streak = 0
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(RATE_MIN, self.rate / 2)
+            self.tokens = 0.0
+            self.streak = 0
+
+def bucket_key(url: str) -> Tuple[str, str]:
+    """(ホスト, エンドポイント) 。lookup と レビューRSS は同じホストでも制限が別なので分ける。
+    RSS は /{country}/rss/... なので先頭セグメントではなく /rss でまとめる"""
+    u = urlparse(url)
+    if "/rss/" in u.path:
+        return u.netloc, "/rss"
+    return u.netloc, "/" + u.path.strip("/").split("/", 1)[0]
+
+class HostBuckets:
+    """(ホスト, エンドポイント) ごとに TokenBucket を遅延生成して保持する"""
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> TokenBucket:
+        key = bucket_key(url)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate)
+            return bucket
+
+BUCKETS = HostBuckets(rate=2.0)  # main() で --sleep から初期レートを設定
+
+def was_throttled(resp: requests.Response) -> bool:
+    """最終応答、または urllib3 Retry が内部で再試行した履歴に 429 が含まれるか"""
+    if resp.status_code == 429:
+        return True
+    retries = getattr(resp.raw, "retries", None)
+    return any(h.status == 429 for h in (getattr(retries, "history", None) or ()))
+
+class Http2Client:
+    """--http2 指定時だけ使う httpx.Client(http2=True)。Client はスレッドセーフなので全ワーカーで共有し、
+    itunes.apple.com への少数の接続上で lookup/RSS を多重化する（httpx は遅延 import）"""
+    def __init__(self):
+        self.client = None
+        self.status_errors: Tuple[type, ...] = ()  # raise_for_status() が投げる例外（有効時は httpx.HTTPStatusError）
+
+    def enable(self, max_connections: int) -> bool:
+        try:
+            import httpx
+            # transport= を渡すと Client 側の http2=/limits= は使われないので、どちらも transport に渡す
+            self.client = httpx.Client(
+                headers=DEFAULT_HEADERS,
+                follow_redirects=True,  # requests と同じくリダイレクトを追う（httpx の既定は追わない）
+                transport=httpx.HTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=max_connections),
+                    retries=2,  # 接続エラーだけ再試行
+                ),
+            )
+        except ImportError as e:
+            print(f"[WARN] --http2 には httpx[http2] が必要です。requests で続行します: {e}")
+            return False
+        self.status_errors = (httpx.HTTPStatusError,)
+        return True
+
+    def get(self, url: str, bucket: TokenBucket, params: Optional[Dict[str, Any]] = None, timeout: float = 30):
+        """urllib3 Retry 相当（429/5xx を指数バックオフ、Retry-After 優先）を自前で行う"""
+        for attempt in range(RETRY_TOTAL + 1):
+            r = self.client.get(url, params=params, timeout=timeout)
+            if r.status_code not in RETRY_STATUS or attempt == RETRY_TOTAL:
+                break
+            if r.status_code == 429:
+                bucket.on_throttle()
+            ra = r.headers.get("Retry-After", "")
+            time.sleep(float(ra) if ra.isdigit() else RETRY_BACKOFF * (2 ** attempt))
+            bucket.acquire()
+        if r.status_code == 429:
+            bucket.on_throttle()
+        elif r.is_success:
+            bucket.on_success()
+        return r
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+H2 = Http2Client()
+
+def throttled_get(url: str, **kwargs) -> requests.Response:
+    """エンドポイント別のトークンバケットでペースを取りながら GET し、結果に応じてレートを調整する"""
+    bucket = BUCKETS.get(url)
+    bucket.acquire()
+    if H2.client is not None:
+        return H2.get(url, bucket, **kwargs)
+    try:
+        r = get_session().get(url, **kwargs)
+    except requests.exceptions.RetryError:
+        # 429/5xx の再試行切れ → 混雑とみなして減速
+        bucket.on_throttle()
+        raise
+    if was_throttled(r):
+        bucket.on_throttle()
+    elif r.ok:
+        bucket.on_success()
+    return r
+
+CACHE = JsonCache(Path(DEFAULT_CACHE_DIR), 7 * 86400)  # main() で --cache-dir/--cache-ttl に合わせる
+
+def get_json(url: str, params: Optional[Dict[str, Any]] = None, timeout: float = 30) -> Dict[str, Any]:
+    """キャッシュに無ければ throttled_get で取得し、200 応答だけキャッシュへ書く"""
+    params = params or {}
+    cached = CACHE.get(url, params)
+    if cached is not None:
+        return cached
+    r = throttled_get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    data = loads_json(r.content)
+    if r.status_code == 200:
+        CACHE.put(url, params, r.content)
+    return data
+
 def lookup_by_track_id(track_id: int, country: str, lang: str) -> Optional[Dict[str, Any]]:
     params = {"id": track_id, "entity": "software", "country": country, "lang": lang}
-    r = requests.get(ITUNES_LOOKUP, params=params, headers=DEFAULT_HEADERS, timeout=30)
-    r.raise_for_status()
-    data = r.json()
+    data = get_json(ITUNES_LOOKUP, params)
     if data.get("resultCount", 0) == 0:
         return None
     return data["results"][0]
@@ -54,13 +254,36 @@ def lookup_by_track_id(track_id: int, country: str, lang: str) -> Optional[Dict[
 def lookup_by_bundle_id(bundle_id: str, country: str, lang: str) -> Optional[Dict[str, Any]]:
     # Apple Lookup API supports bundleId parameter as identifier
     params = {"bundleId": bundle_id, "entity": "software", "country": country, "lang": lang}
-    r = requests.get(ITUNES_LOOKUP, params=params, headers=DEFAULT_HEADERS, timeout=30)
-    r.raise_for_status()
-    data = r.json()
+    data = get_json(ITUNES_LOOKUP, params)
     if data.get("resultCount", 0) == 0:
         return None
     return data["results"][0]
 
+LOOKUP_BATCH = 150  # lookup の id= にまとめる件数（API上限は約200）
+LOOKUP_AHEAD = 2    # 先読みする lookup バッチ数（= lookup 用スレッド数）
+
+def lookup_batch(track_ids: List[int], country: str, lang: str) -> Dict[int, Dict[str, Any]]:
+    """trackId をカンマ区切りでまとめて1回で lookup し、{trackId: rec} を返す（見つからないIDは含まれない）"""
+    params = {"id": ",".join(map(str, track_ids)), "entity": "software", "country": country, "lang": lang}
+    data = get_json(ITUNES_LOOKUP, params)
+    return {r["trackId"]: r for r in data.get("results", []) if r.get("trackId") is not None}
+
+def prefetch_batch(track_ids: List[int], country: str, lang: str) -> Optional[Dict[int, Dict[str, Any]]]:
+    """lookup_batch の失敗を握りつぶして None を返す（その分は collect_one で1件ずつ取り直す）"""
+    try:
+        return lookup_batch(track_ids, country, lang)
+    except Exception as e:
+        print(f"[ERROR {country} batch of {len(track_ids)} ids] {e}")
+        return None
+
+def chunked(items: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
 def infer_has_iap_guess(rec: Dict[str, Any]) -> Optional[bool]:
     desc = (rec.get("description") or "").lower()
     hints = ["subscription", "in-app", "premium", "upgrade", "課金", "サブスクリプション"]
@@ -68,10 +291,14 @@ def infer_has_iap_guess(rec: Dict[str, Any]) -> Optional[bool]:
         return True
     return None  # unknown (APIではIAPフラグが常に取れないため)
 
+def _sc(vs: Optional[List[str]]) -> Optional[str]:
+    """; 区切りで連結。空リスト/欠損は None"""
+    return ";".join(vs) if vs else None
+
 def norm_meta(rec: Dict[str, Any], country: str, lang: str, app_key: Optional[str], query_name: Optional[str]) -> Dict[str, Any]:
     def j(val):
         try:
-            return json.dumps(val or [], ensure_ascii=False)
+            return dumps_json(val or [])
         except Exception:
             return "[]"
 
@@ -90,9 +317,9 @@ def norm_meta(rec: Dict[str, Any], country: str, lang: str, app_key: Optional[st
         "currentVersionReleaseDate": rec.get("currentVersionReleaseDate"),
         "version": rec.get("version"),
         "primaryGenreName": rec.get("primaryGenreName"),
-        "genres": ";".join(rec.get("genres", [])),
+        "genres": _sc(rec.get("genres")),
         "contentAdvisoryRating": rec.get("contentAdvisoryRating"),  # Age rating
-        "languageCodesISO2A": ";".join(rec.get("languageCodesISO2A", [])),
+        "languageCodesISO2A": _sc(rec.get("languageCodesISO2A")),
         "averageUserRating": rec.get("averageUserRating"),
         "userRatingCount": rec.get("userRatingCount"),
         "averageUserRatingForCurrentVersion": rec.get("averageUserRatingForCurrentVersion"),
@@ -112,63 +339,354 @@ def norm_meta(rec: Dict[str, Any], country: str, lang: str, app_key: Optional[st
     }
     return out
 
-def download_screenshots(urls: List[str], outdir: Path, max_count: int, sleep_sec: float):
-    outdir.mkdir(parents=True, exist_ok=True)
-    for i, url in enumerate(urls[:max_count], 1):
-        try:
-            ext = ".jpg"
-            lower = url.lower()
-            if ".png" in lower: ext = ".png"
-            elif ".jpeg" in lower: ext = ".jpeg"
-            fp = outdir / f"{i:02d}{ext}"
-            if fp.exists():
-                continue
-            resp = requests.get(url, headers=DEFAULT_HEADERS, timeout=40)
+DL_CHUNK = 64 * 1024
+
+class ImageStore:
+    """スクショの URL → (etag, last_modified, sha1) を sqlite に持ち、実体は by_url/<sha1(url)> に1つだけ置く
+    （--image-format webp/jpeg のときは変換済みの by_url/<sha1(url)>.<ext> だけを置く）。
+    各国・各アプリの保存先へはハードリンク（不可ならコピー）で配る"""
+    def __init__(self, root: Path):
+        self.blob_dir = root / "by_url"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(root / "images.sqlite"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, sha1 TEXT)"
+        )
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.fresh = set()  # この実行中に検証済みの URL（国をまたいだ同一URLは再検証しない）
+        self.url_locks: Dict[str, threading.Lock] = {}  # 同じ URL を複数スレッドが同時に取りに行かないように
+
+    def blob_path(self, url: str) -> Path:
+        return self.blob_dir / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _row(self, key: str) -> Optional[Tuple[Optional[str], Optional[str], str]]:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT etag, last_modified, sha1 FROM images WHERE url = ?", (key,)
+            ).fetchone()
+
+    def _save(self, key: str, etag: Optional[str], last_modified: Optional[str], sha1: str):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images (url, etag, last_modified, sha1) VALUES (?, ?, ?, ?)",
+                (key, etag, last_modified, sha1),
+            )
+            self.conn.commit()
+            self.fresh.add(key)
+
+    def fetch(self, url: str, image_format: str = "raw") -> Path:
+        """blob を最新にしてパスを返す。raw 以外なら変換済みの blob だけを置き、元画像は残さない"""
+        with self.lock:
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            return self._fetch(url, image_format)
+
+    def _fetch(self, url: str, image_format: str) -> Path:
+        raw_blob = self.blob_path(url)
+        if image_format == "raw":
+            key, blob = url, raw_blob
+        else:
+            # 変換済み blob は by_url/<sha1(url)>.<ext>。etag 等は形式ごとに別の行（キー "<url>#<形式>"）で持ち、
+            # 別形式で取った時の etag で 304 になって古い変換結果を使う、ということがないようにする
+            key, blob = f"{url}#{image_format}", raw_blob.with_name(raw_blob.name + IMAGE_FORMATS[image_format][0])
+        row = self._row(key) if blob.exists() else None
+        if row and key in self.fresh:
+            return blob
+
+        headers = {}
+        if row:
+            etag, last_modified, _ = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        with get_session().get(url, headers=headers, timeout=40, stream=True) as resp:
+            if resp.status_code == 304 and row:
+                with self.lock:
+                    self.fresh.add(key)
+                return blob
             resp.raise_for_status()
-            fp.write_bytes(resp.content)
-            time.sleep(sleep_sec)
-        except Exception as e:
-            print(f"[WARN] screenshot DL failed: {url} -> {e}")
+
+            # 画像全体をメモリに載せず 64KB ずつ .part に書き、終わったら rename（raw 以外は .part から変換して捨てる）
+            digest = hashlib.sha1()
+            part = raw_blob.with_name(f"{raw_blob.name}.{threading.get_ident()}.part")
+            try:
+                with open(part, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=DL_CHUNK):
+                        f.write(chunk)
+                        digest.update(chunk)
+                if image_format == "raw":
+                    os.replace(part, blob)
+                else:
+                    _, pil_format, opts = IMAGE_FORMATS[image_format]
+                    transcode(part, blob, pil_format, opts)
+                    part.unlink()
+                    raw_blob.unlink(missing_ok=True)  # 以前 raw で取った元画像が残っていれば消す
+            except BaseException:
+                part.unlink(missing_ok=True)  # 途中で切れた .part を残さない（次回は最初から取り直す）
+                raise
+            self._save(key, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), digest.hexdigest())
+        return blob
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# --image-format: 拡張子, Pillow のフォーマット名, save() のオプション
+IMAGE_FORMATS = {
+    "webp": (".webp", "WEBP", {"quality": 85, "method": 4}),
+    "jpeg": (".jpg", "JPEG", {"quality": 85, "progressive": True, "optimize": True}),
+}
+
+def transcode(src: Path, dst: Path, pil_format: str, opts: Dict[str, Any]):
+    from PIL import Image  # --image-format raw なら Pillow は不要
+    tmp = dst.with_name(f"{dst.name}.{threading.get_ident()}.tmp")
+    with Image.open(src) as im:
+        im.convert("RGB").save(tmp, pil_format, **opts)
+    os.replace(tmp, dst)
+
+def link_or_copy(src: Path, dst: Path):
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        return  # 同じアプリ×国の重複行などで別スレッドが先に置いた
+    except OSError:
+        shutil.copyfile(src, dst)
+
+# 画像は lookup API とは別ホスト（mzstatic CDN）なので専用プールで並列に落とす。
+# ワーカーが別スレッドなので Session（接続プール）も lookup 用とは別になる
+IMG_WORKERS = 8
+IMG_EXECUTOR = ThreadPoolExecutor(max_workers=IMG_WORKERS, thread_name_prefix="img")
+IMG_EXTS = frozenset({".jpg", ".jpeg", ".png"})
+
+def _dl_one(job: Tuple[str, Path, ImageStore, str]):
+    url, fp, store, image_format = job
+    try:
+        if fp.exists():
+            return
+        link_or_copy(store.fetch(url, image_format), fp)
+    except Exception as e:
+        print(f"[WARN] screenshot DL failed: {url} -> {e}")
+
+def download_screenshots(targets: List[Tuple[List[str], Path]], max_count: int, store: ImageStore, image_format: str = "raw"):
+    """(URL群, 保存先ディレクトリ) の組をまとめて受け取り、全デバイス分を IMG_EXECUTOR で並列DLする"""
+    jobs: List[Tuple[str, Path, ImageStore, str]] = []
+    for urls, outdir in targets:
+        outdir.mkdir(parents=True, exist_ok=True)
+        for i, url in enumerate(urls[:max_count], 1):
+            if image_format != "raw":
+                ext = IMAGE_FORMATS[image_format][0]
+            else:
+                ext = Path(urlparse(url).path).suffix.lower()  # クエリ文字列は見ない
+                if ext not in IMG_EXTS:
+                    ext = ".jpg"
+            jobs.append((url, outdir / f"{i:02d}{ext}", store, image_format))
+    list(IMG_EXECUTOR.map(_dl_one, jobs))
+
+def build_review_row(e: Dict[str, Any], country: str, track_id: int) -> Dict[str, Any]:
+    return {
+        "country": country,
+        "trackId": track_id,
+        "author": e.get("author", {}).get("name", {}).get("label"),
+        "title": e.get("title", {}).get("label"),
+        "content": e.get("content", {}).get("label"),
+        "rating": e.get("im:rating", {}).get("label"),
+        "version": e.get("im:version", {}).get("label"),
+        "updated": e.get("updated", {}).get("label"),
+        "id": e.get("id", {}).get("label"),
+    }
 
 def fetch_reviews(track_id: int, country: str, limit: int) -> List[Dict[str, Any]]:
     url = REVIEWS_RSS.format(country=country.lower(), track_id=track_id)
     try:
-        r = requests.get(url, headers=DEFAULT_HEADERS, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        data = get_json(url)  # trackId+country ごとに URL が決まるのでそのままキャッシュキーになる
     except Exception:
         return []
     feed = data.get("feed", {})
     entries = feed.get("entry", [])
-    reviews: List[Dict[str, Any]] = []
-    for e in entries:
-        if "im:rating" in e and "im:version" in e:
-            reviews.append({
-                "country": country.upper(),
-                "trackId": track_id,
-                "author": e.get("author", {}).get("name", {}).get("label"),
-                "title": e.get("title", {}).get("label"),
-                "content": e.get("content", {}).get("label"),
-                "rating": e.get("im:rating", {}).get("label"),
-                "version": e.get("im:version", {}).get("label"),
-                "updated": e.get("updated", {}).get("label"),
-                "id": e.get("id", {}).get("label"),
-            })
-            if len(reviews) >= limit:
-                break
-    return reviews
+    # 先頭のアプリ情報エントリ等を除き、レビューだけ limit 件まで
+    country = country.upper()
+    rows = (build_review_row(e, country, track_id) for e in entries if "im:rating" in e and "im:version" in e)
+    return list(islice(rows, limit))
+
+REVIEW_WORKERS = 2
+
+class ReviewWriter:
+    """(trackId, country) をキューで受け取り、バックグラウンドのスレッドでレビューRSSを取って reviews.csv に追記する。
+    レビューは任意かつ独立なので、メタデータ側の処理を待たせない"""
+    def __init__(self, f: IO[str], writer: csv.DictWriter, limit: int, n_workers: int = REVIEW_WORKERS,
+                 seen: Optional[set] = None):
+        self.f = f
+        self.writer = writer
+        self.limit = limit
+        self.seen = seen or set()  # 既に reviews.csv にある (trackId, 国, レビューid)。--resume で重複を書かない
+        self.q: "queue.Queue[Optional[Tuple[int, str]]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.n_rows = 0
+        self.threads = [threading.Thread(target=self._run, name=f"reviews-{i}", daemon=True) for i in range(n_workers)]
+        for t in self.threads:
+            t.start()
+
+    def put(self, track_id: int, country: str):
+        self.q.put((track_id, country))
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                return
+            try:
+                rows = fetch_reviews(item[0], item[1], self.limit)
+            except Exception as e:
+                print(f"[WARN] reviews failed {item}: {e}")
+                continue
+            if self.seen:
+                rows = [r for r in rows if (str(r["trackId"]), r["country"], r["id"]) not in self.seen]
+            if not rows:
+                continue
+            with self.lock:
+                self.writer.writerows(rows)
+                self.n_rows += len(rows)
+                if self.n_rows >= FLUSH_EVERY:
+                    self.f.flush()
+                    self.n_rows = 0
+
+    def close(self):
+        """キューに残った分を処理し終えるまで待つ"""
+        for _ in self.threads:
+            self.q.put(None)
+        for t in self.threads:
+            t.join()
+
+def collect_one(base: Dict[str, Any], country: str, lang: str, prefetched: bool, rec: Optional[Dict[str, Any]],
+                ss_dir: Path, store: ImageStore, args) -> Optional[Dict[str, Any]]:
+    """1アプリ×1国分の lookup・スクショDL（ワーカースレッドで実行）。メタデータ行を返す。
+    prefetched のときは lookup_batch 済みの rec（見つからなければ None）をそのまま使う"""
+    track_id = base.get("trackId")
+    bundle_id = base.get("bundleId")
+    app_key = base.get("app_key")
+    query_name = base.get("query_name")
+
+    try:
+        if prefetched:
+            pass
+        elif track_id:
+            rec = lookup_by_track_id(track_id, country, lang)
+        else:
+            rec = lookup_by_bundle_id(bundle_id, country, lang)
+    except (requests.HTTPError, *H2.status_errors) as e:
+        # 429/5xx は Retry 側で再試行済み。ここに来るのは恒久的なエラーか再試行切れ
+        print(f"[HTTP {country} id={track_id or bundle_id}] {e}")
+        return None
+    except Exception as e:
+        print(f"[ERROR {country} id={track_id or bundle_id}] {e}")
+        return None
+
+    if not rec:
+        # その国のストアでは見つからない可能性もある
+        return None
+
+    # メタデータ
+    meta = norm_meta(rec, country, lang, app_key, query_name)
+
+    # スクリーンショット（iPhone / iPad / Apple TV をまとめて並列DL）
+    app_dir = ss_dir / country.lower() / str(rec.get("trackId"))
+    targets = [
+        (rec.get(field, []) or [], app_dir / device)
+        for field, device in (("screenshotUrls", "iphone"), ("ipadScreenshotUrls", "ipad"), ("appletvScreenshotUrls", "appletv"))
+    ]
+    download_screenshots([t for t in targets if t[0]], args.max_screenshots, store, args.image_format)
+
+    return meta
+
+ID_COLS = ["app_key", "query_name", "trackId", "bundleId"]
+
+# 出力CSVの列（列順の見やすさを少し整えたもの）
+META_COLS = [
+    "app_key","query_name","country","lang","trackId","bundleId","trackName",
+    "sellerName","developerName","primaryGenreName","genres",
+    "contentAdvisoryRating","languageCodesISO2A",
+    "averageUserRating","userRatingCount",
+    "averageUserRatingForCurrentVersion","userRatingCountForCurrentVersion",
+    "price","formattedPrice","currency",
+    "minimumOsVersion","supportedDevices_count",
+    "releaseDate","currentVersionReleaseDate","version",
+    "has_in_app_purchases_guess",
+    "trackViewUrl","sellerUrl",
+    "screenshotUrls_json","ipadScreenshotUrls_json","appletvScreenshotUrls_json",
+    "description"
+]
+REVIEW_COLS = ["country","trackId","author","title","content","rating","version","updated","id"]
+FLUSH_EVERY = 50  # この件数ごとにファイルへ flush
+
+def open_csv_writer(stack: contextlib.ExitStack, path: Path, fieldnames: List[str], append: bool = False) -> Tuple[IO[str], csv.DictWriter]:
+    """DictWriter とそのファイルを返す（ファイルは stack が閉じる）。append 時は既存ファイルに追記しヘッダは書かない"""
+    append = append and path.exists() and path.stat().st_size > 0
+    f = stack.enter_context(path.open("a" if append else "w", encoding="utf-8", newline=""))
+    w = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL, extrasaction="ignore")
+    if not append:
+        w.writeheader()
+    return f, w
+
+def truncate_partial_tail(path: Path):
+    """強制終了で途中まで書かれた末尾の行を、最後の完全な行の直後まで切り詰める（--resume の読み込み・追記の前に呼ぶ）。
+    csv モジュールは改行や引用符を含む値を "..." で囲む（中の " は "" になる）ので、
+    先頭から引用符の偶奇を数えて、引用符の外にある最後の改行までを完全な行とみなす"""
+    if not path.exists():
+        return
+    data = path.read_bytes()
+    good = pos = 0
+    in_quotes = False
+    for line in data.split(b"\n"):
+        pos += len(line) + 1
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes and pos <= len(data):
+            good = pos
+    if good < len(data):
+        with path.open("r+b") as f:
+            f.truncate(good)
+        print(f"[WARN] resume: dropped {len(data) - good} bytes of a partial last row in {path}")
+
+def read_done_keys(path: Path) -> Tuple[set, set]:
+    """既存 metadata.csv から取得済みの (ID, 国, 言語) を集める。ID は trackId と bundleId の両方を入れる。
+    あわせてレビュー取得の対象になる (trackId, 国) も返す"""
+    if not path.exists() or path.stat().st_size == 0:
+        return set(), set()
+    df = pd.read_csv(path, usecols=["trackId", "bundleId", "country", "lang"], dtype=str, keep_default_na=False)
+    countries = df["country"].str.upper()
+    done = set()
+    for tid, bid, country, lang in zip(df["trackId"], df["bundleId"], countries, df["lang"]):
+        if tid:
+            done.add((tid, country, lang))
+        if bid:
+            done.add((bid, country, lang))
+    apps = {(tid, country) for tid, country in zip(df["trackId"], countries) if tid.isdigit()}
+    return done, apps
+
+def read_review_keys(path: Path) -> Tuple[set, set]:
+    """既存 reviews.csv にある (trackId, 国) と (trackId, 国, レビューid) を集める（--resume 用）。
+    レビューは ReviewWriter が metadata.csv とは別のタイミングで書くので、取得済みかどうかは reviews.csv 側で判断する"""
+    if not path.exists() or path.stat().st_size == 0:
+        return set(), set()
+    df = pd.read_csv(path, usecols=["country", "trackId", "id"], dtype=str, keep_default_na=False)
+    countries = df["country"].str.upper()
+    apps = set(zip(df["trackId"], countries))
+    ids = {(tid, country, rid) for tid, country, rid in zip(df["trackId"], countries, df["id"]) if rid}
+    return apps, ids
 
 def read_ids_csv(path: Path) -> List[Dict[str, Any]]:
-    df = pd.read_csv(path)
-    rows: List[Dict[str, Any]] = []
-    for _, r in df.iterrows():
-        rows.append({
-            "app_key": None if pd.isna(r.get("app_key", None)) else str(r.get("app_key")),
-            "query_name": None if pd.isna(r.get("query_name", None)) else str(r.get("query_name")),
-            "trackId": None if pd.isna(r.get("trackId", None)) else int(r.get("trackId")),
-            "bundleId": None if pd.isna(r.get("bundleId", None)) else str(r.get("bundleId")),
-        })
-    return rows
+    # 列単位で型を揃えてから一括で dict 化する（iterrows/行ごとの isna をしない）
+    df = pd.read_csv(
+        path,
+        dtype={"app_key": "string", "query_name": "string", "bundleId": "string"},
+        usecols=lambda c: c in ID_COLS,
+    )
+    df = df.reindex(columns=ID_COLS)  # 無い列は全欠損として扱う
+    df["trackId"] = pd.to_numeric(df["trackId"], errors="coerce").astype("Int64")
+    df = df.astype(object)
+    return df.where(df.notna(), None).to_dict("records")
 
 def main():
     ap = argparse.ArgumentParser()
@@ -179,11 +697,28 @@ def main():
     ap.add_argument("--save-reviews", action="store_true")
     ap.add_argument("--reviews-per-country", type=int, default=50)
     ap.add_argument("--max-screenshots", type=int, default=12, help="各デバイス種別(Phone/iPad/TV)ごとの最大DL枚数")
-    ap.add_argument("--sleep", type=float, default=0.5, help="API呼び出し間のsleep秒")
+    ap.add_argument("--image-format", choices=["raw", *IMAGE_FORMATS], default="raw",
+                    help="スクショの保存形式。raw=元のまま、webp/jpeg=Pillow で再エンコード（q=85）してディスクを節約")
+    ap.add_argument("--sleep", type=float, default=0.5, help="API呼び出し間隔の初期値（秒）。エンドポイントごとに 1/sleep req/s から始めて 2xx/429 に応じて自動調整")
+    ap.add_argument("--max-workers", type=int, default=8, help="アプリ×国の処理を並列に行うスレッド数")
+    ap.add_argument("--http2", action="store_true", help="lookup/レビューRSS を httpx の HTTP/2 クライアントで多重化する（要 httpx[http2]）")
+    ap.add_argument("--http2-connections", type=int, default=16, help="--http2 時の最大接続数")
+    ap.add_argument("--resume", action="store_true", help="既存の metadata.csv/reviews.csv に追記し、取得済みの (ID, 国, 言語) は飛ばす")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="lookup/レビューRSS応答のキャッシュ先（appstore_resolver.py と同じ既定）")
+    ap.add_argument("--cache-ttl", type=float, default=7 * 86400, help="キャッシュ有効秒数（0以下でキャッシュ無効）")
     args = ap.parse_args()
+    if args.image_format != "raw":
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            ap.error("--image-format webp/jpeg には Pillow が必要です（pip install pillow）")
+    BUCKETS.rate = 1.0 / max(args.sleep, 0.01)
 
     outdir = Path(args.outdir); outdir.mkdir(parents=True, exist_ok=True)
+    CACHE.root = Path(args.cache_dir)
+    CACHE.ttl = args.cache_ttl
     ss_dir = outdir / "screenshots"; ss_dir.mkdir(exist_ok=True)
+    store = ImageStore(outdir / ".image_cache")
 
     # country -> lang
     lang_map: Dict[str, str] = {}
@@ -196,101 +731,115 @@ def main():
 
     id_rows = read_ids_csv(Path(args.input_ids))
 
-    meta_rows: List[Dict[str, Any]] = []
-    review_rows: List[Dict[str, Any]] = []
-
-    for base in tqdm(id_rows, desc="Apps"):
-        track_id = base.get("trackId")
-        bundle_id = base.get("bundleId")
-        app_key = base.get("app_key")
-        query_name = base.get("query_name")
-
+    # 同じ (ID種別, ID, 国, 言語) は1回だけ取りに行き、その結果を同じIDを持つ全行へ配る
+    groups: Dict[Tuple[str, Any, str, str], List[Dict[str, Any]]] = {}
+    for base in id_rows:
+        if base.get("trackId"):
+            kind, value = "trackId", base["trackId"]
+        elif base.get("bundleId"):
+            kind, value = "bundleId", base["bundleId"]
+        else:
+            print(f"[WARN] no ID for row app_key={base.get('app_key')}, query_name={base.get('query_name')}")
+            continue
         for country in args.countries:
             lang = lang_map[country.lower()]
-            rec: Optional[Dict[str, Any]] = None
-
-            try:
-                if track_id:
-                    rec = lookup_by_track_id(track_id, country, lang)
-                elif bundle_id:
-                    rec = lookup_by_bundle_id(bundle_id, country, lang)
-                else:
-                    print(f"[WARN] no ID for row app_key={app_key}, query_name={query_name}")
+            groups.setdefault((kind, value, country, lang), []).append(base)
+
+    # タスクはスレッドプールで並列に処理し、結果は投入順にメインスレッドで受け取って
+    # そのまま CSV に書く（全件をメモリに溜めない／途中で止まっても書いた分は残る）
+    # --resume: 既存 metadata.csv にある (ID, 国, 言語) は取りに行かない
+    done_apps: set = set()
+    review_apps: set = set()
+    review_ids: set = set()
+    if args.resume:
+        # 前回が途中で落ちていると最後の行が欠けている（引用符の途中で切れると read_csv が失敗し、
+        # そうでなくても追記した行が欠けた行にくっつく）ので、先に完全な行まで戻しておく
+        truncate_partial_tail(outdir / "metadata.csv")
+        truncate_partial_tail(outdir / "reviews.csv")
+        done, done_apps = read_done_keys(outdir / "metadata.csv")
+        groups = {k: v for k, v in groups.items() if (str(k[1]), k[2].upper(), k[3]) not in done}
+        print(f"[INFO] resume: {len(done)} keys already collected, {len(groups)} tasks remaining")
+        if args.save_reviews:
+            review_apps, review_ids = read_review_keys(outdir / "reviews.csv")
+
+    n_written = 0
+    with contextlib.ExitStack() as stack:
+        meta_f, meta_w = open_csv_writer(stack, outdir / "metadata.csv", META_COLS, append=args.resume)
+        stack.callback(store.close)
+        if args.http2 and H2.enable(args.http2_connections):
+            stack.callback(H2.close)
+        reviews: Optional[ReviewWriter] = None
+        if args.save_reviews:
+            reviews = ReviewWriter(*open_csv_writer(stack, outdir / "reviews.csv", REVIEW_COLS, append=args.resume),
+                                   limit=args.reviews_per_country, seen=review_ids)
+            stack.callback(reviews.close)
+            if args.resume:
+                # metadata は取れているがレビューがまだ無いアプリ（前回キューに残ったまま落ちた分）を取り直す
+                missing = sorted(done_apps - review_apps)
+                for tid, country in missing:
+                    reviews.put(int(tid), country)
+                print(f"[INFO] resume: re-queued reviews for {len(missing)} collected apps")
+        stack.callback(IMG_EXECUTOR.shutdown)
+        ex = stack.enter_context(ThreadPoolExecutor(max_workers=args.max_workers))
+
+        # trackId の行は国ごとに LOOKUP_BATCH 件ずつまとめて lookup し、バッチが返ったらそのバッチの collect_one を
+        # すぐ投入する（bundleId の行は lookup 無しの単位として collect_one で1件ずつ）。
+        # lookup は LOOKUP_AHEAD バッチ先まで別プールで先読みし、処理待ちのタスクも約 LOOKUP_BATCH 件に抑えるので、
+        # lookup レコードを全件抱えず、metadata.csv への書き出しとスクショDLも最初のバッチから始まる
+        keys_by_cl: Dict[Tuple[str, str], List[Tuple[str, Any, str, str]]] = {}
+        units: List[Tuple[Optional[Tuple[List[int], str, str]], List[Tuple[str, Any, str, str]]]] = []
+        for key in groups:
+            if key[0] == "trackId":
+                keys_by_cl.setdefault((key[2], key[3]), []).append(key)
+            else:
+                units.append((None, [key]))
+        units[:0] = [
+            (([k[1] for k in keys], country, lang), keys)
+            for (country, lang), cl_keys in keys_by_cl.items() for keys in chunked(cl_keys, LOOKUP_BATCH)
+        ]
+        lookup_ex = stack.enter_context(ThreadPoolExecutor(max_workers=LOOKUP_AHEAD))
+
+        def submit_lookup(unit) -> Optional[Future]:
+            return lookup_ex.submit(prefetch_batch, *unit[0]) if unit[0] else None
+
+        pbar = stack.enter_context(tqdm(total=len(groups), desc="Apps"))
+        task_futs: deque = deque()  # (collect_one の Future, 同じIDを持つ行群) を投入順に
+
+        def write_done(block_until: int):
+            """先頭から終わったタスクの結果を書く。未完了が block_until 件を超える間は先頭を待つ"""
+            nonlocal n_written
+            while task_futs and (len(task_futs) > block_until or task_futs[0][0].done()):
+                fut, bases = task_futs.popleft()
+                pbar.update(1)
+                meta = fut.result()
+                if not meta:
                     continue
-            except requests.HTTPError as e:
-                print(f"[HTTP {country} id={track_id or bundle_id}] {e}")
-                time.sleep(args.sleep)
-                continue
-            except Exception as e:
-                print(f"[ERROR {country} id={track_id or bundle_id}] {e}")
-                time.sleep(args.sleep)
-                continue
-
-            if not rec:
-                # その国のストアでは見つからない可能性もある
-                time.sleep(args.sleep)
-                continue
-
-            # メタデータ
-            meta = norm_meta(rec, country, lang, app_key, query_name)
-            meta_rows.append(meta)
-
-            # スクリーンショット（iPhone）
-            ph_urls = rec.get("screenshotUrls", []) or []
-            if ph_urls:
-                dest = ss_dir / country.lower() / str(rec.get("trackId")) / "iphone"
-                download_screenshots(ph_urls, dest, args.max_screenshots, sleep_sec=0.2)
-
-            # iPad
-            ipad_urls = rec.get("ipadScreenshotUrls", []) or []
-            if ipad_urls:
-                dest = ss_dir / country.lower() / str(rec.get("trackId")) / "ipad"
-                download_screenshots(ipad_urls, dest, args.max_screenshots, sleep_sec=0.2)
-
-            # Apple TV
-            tv_urls = rec.get("appletvScreenshotUrls", []) or []
-            if tv_urls:
-                dest = ss_dir / country.lower() / str(rec.get("trackId")) / "appletv"
-                download_screenshots(tv_urls, dest, args.max_screenshots, sleep_sec=0.2)
-
-            # レビュー（任意）
-            if args.save_reviews and rec.get("trackId"):
-                try:
-                    reviews = fetch_reviews(int(rec["trackId"]), country, args.reviews_per_country)
-                    review_rows.extend(reviews)
-                except Exception:
-                    pass
-
-            time.sleep(args.sleep)
-
-    # 保存
-    meta_df = pd.DataFrame(meta_rows)
-    # 列順の見やすさを少し整える
-    preferred_cols = [
-        "app_key","query_name","country","lang","trackId","bundleId","trackName",
-        "sellerName","developerName","primaryGenreName","genres",
-        "contentAdvisoryRating","languageCodesISO2A",
-        "averageUserRating","userRatingCount",
-        "averageUserRatingForCurrentVersion","userRatingCountForCurrentVersion",
-        "price","formattedPrice","currency",
-        "minimumOsVersion","supportedDevices_count",
-        "releaseDate","currentVersionReleaseDate","version",
-        "has_in_app_purchases_guess",
-        "trackViewUrl","sellerUrl",
-        "screenshotUrls_json","ipadScreenshotUrls_json","appletvScreenshotUrls_json",
-        "description"
-    ]
-    # 存在する列だけ並べ替え
-    cols = [c for c in preferred_cols if c in meta_df.columns] + [c for c in meta_df.columns if c not in preferred_cols]
-    meta_df = meta_df.reindex(columns=cols)
-    meta_df.to_csv(outdir / "metadata.csv", index=False, quoting=csv.QUOTE_MINIMAL)
-
-    if review_rows:
-        rv_df = pd.DataFrame(review_rows)
-        rv_df.to_csv(outdir / "reviews.csv", index=False, quoting=csv.QUOTE_MINIMAL)
+                if reviews and meta.get("trackId"):
+                    reviews.put(int(meta["trackId"]), meta["country"])
+                for base in bases:
+                    meta_w.writerow({**meta, "app_key": base.get("app_key"), "query_name": base.get("query_name")})
+                    n_written += 1
+                    if n_written % FLUSH_EVERY == 0:
+                        meta_f.flush()
+
+        unit_iter = iter(units)
+        ahead = deque((unit, submit_lookup(unit)) for unit in islice(unit_iter, LOOKUP_AHEAD))
+        while ahead:
+            (batch, keys), lookup_fut = ahead.popleft()
+            ahead.extend((unit, submit_lookup(unit)) for unit in islice(unit_iter, 1))
+            found = lookup_fut.result() if lookup_fut else None
+            write_done(block_until=LOOKUP_BATCH)
+            for key in keys:
+                _, value, country, lang = key
+                # バッチ lookup が失敗した（found is None）IDは collect_one で1件ずつ取り直す
+                rec = found.get(value) if found is not None else None
+                task_futs.append((ex.submit(collect_one, groups[key][0], country, lang, found is not None, rec,
+                                            ss_dir, store, args), groups[key]))
+            del found  # このバッチのレコードはタスクに渡した分だけが残る
+        write_done(block_until=0)
 
     print(f"Saved: {outdir/'metadata.csv'}")
-    if review_rows:
+    if args.save_reviews:
         print(f"Saved: {outdir/'reviews.csv'}")
     print(f"Screenshots: {ss_dir.resolve()}")
 
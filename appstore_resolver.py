@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, csv, json, time
+import argparse, contextlib, csv, random, re, threading, time
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-from rapidfuzz import fuzz, process
+from rapidfuzz import fuzz, process, utils
 from tqdm import tqdm
+from itunes_cache import DEFAULT_CACHE_DIR, JsonCache, dumps_json, loads_json
 
 ITUNES_SEARCH = "https://itunes.apple.com/search"
 ITUNES_LOOKUP = "https://itunes.apple.com/lookup"
@@ -16,7 +24,150 @@ DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; AppResolver/1.0)"
 }
 
-HEALTHY_GENRES = {"Health & Fitness", "Medical"}  # 妊活系の重み付け用
+# Session はスレッドセーフではないので、ワーカースレッドごとに1つ持たせる（appstore_collect.py と同じ方式）
+POOL_MAXSIZE = 4  # 1スレッドは逐次に GET するので少数で足りる
+_tls = threading.local()
+
+def make_session() -> requests.Session:
+    """keep-alive セッション（itunes.apple.com への TCP/TLS 接続を使い回す）"""
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE))
+    return session
+
+def get_session() -> requests.Session:
+    """ワーカースレッドごとに1つの Session を作って使い回す"""
+    session = getattr(_tls, "session", None)
+    if session is None:
+        session = _tls.session = make_session()
+    return session
+
+HEALTHY_GENRES = frozenset({"Health & Fitness", "Medical"})  # 妊活系の重み付け用
+MAX_BONUS = 8 + 25 + 3  # score_candidate の dev/bundle/genre 加点の最大合計
+
+REVIEW_TOP_N = 5  # needs_review に書き出す上位件数
+MATCH_MODES = ["exact", "startswith", "contains", "fuzzy"]  # details に入る順
+# fuzzy のスコアラー名 → (scorer, processor)。既定は wratio。
+# token_set は語順・余分な語に強いが、クエリの語を含む候補名がすべて 100 になり、完全一致のアプリと
+# その派生名（"Flo" と "Flo Period Tracker" など）が同点になって min_gap で自動確定できなくなるので明示指定のみ。
+# 入力は norm 済みなので wratio は processor 無し、token_set は記号除去のため default_process を掛ける
+FUZZY_SCORERS = {
+    "wratio": (fuzz.WRatio, None),
+    "token_set": (fuzz.token_set_ratio, utils.default_process),
+}
+ROW_COLS = ["app_key","query_name","trackId","bundleId","trackName","sellerName","primaryGenreName"]
+MASTER_COLS = ROW_COLS + ["languageCodesISO2A","releaseDate","countries_found","score_total","score_breakdown"]
+REVIEW_COLS = ROW_COLS + ["countries_found","score_total","score_breakdown"]
+BONUS_COLS = ["dev_bonus","bundle_bonus","genre_bonus","total"]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+LOOKUP_BATCH = 150  # lookup の id= にまとめる件数（API上限は約200）
+LOOKUP_WORKERS = 2
+FINAL_FIELDS = ("bundleId", "releaseDate")  # 検索レコードにこれがそろっていれば lookup し直さない
+SEARCH_AHEAD = 4  # 検索を先読みして投入しておく行数 = --workers × これ
+# 検索結果のうちスコアリング・出力で使う項目（説明文やスクショURL等は持ち続けない）
+SEARCH_FIELDS = ("trackId", "bundleId", "trackName", "sellerName", "artistName",
+                 "primaryGenreName", "genres", "languageCodesISO2A", "releaseDate")
+
+class RateLimiter:
+    """全スレッド共通のトークンバケット。
+    429 で一時停止＋減速し、成功が続けば base_rate まで戻す。X-RateLimit-* があればそれに合わせる。"""
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.base_rate = self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._resume_at = 0.0
+        self._ok_streak = 0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.base_rate = self.rate = rate
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now >= self._resume_at and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                delay = max(self._resume_at - now, (1.0 - self._tokens) / self.rate)
+            time.sleep(delay)
+
+    def on_success(self, headers):
+        with self._lock:
+            remaining, reset = headers.get("X-RateLimit-Remaining"), headers.get("X-RateLimit-Reset")
+            if remaining is not None and reset is not None:
+                try:
+                    remaining, reset = float(remaining), float(reset)
+                except ValueError:
+                    return
+                # Reset は「残り秒」か「epoch秒」のどちらもありうる
+                secs = reset - time.time() if reset > 1e9 else reset
+                if secs > 0:
+                    if remaining < 1:
+                        self._resume_at = max(self._resume_at, time.monotonic() + secs)
+                    else:
+                        self.rate = remaining / secs
+                return
+            self._ok_streak += 1
+            if self._ok_streak >= 20 and self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate * 1.25)
+                self._ok_streak = 0
+
+    def on_throttle(self, delay: float):
+        with self._lock:
+            self.rate = max(self.base_rate / 16, self.rate / 2)
+            self._ok_streak = 0
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+LIMITER = RateLimiter(1 / 0.4)
+
+CACHE = JsonCache(Path(DEFAULT_CACHE_DIR), 86400)
+
+def backoff_delay(resp: Optional[requests.Response], attempt: int) -> float:
+    """Retry-After があればそれを、無ければ指数バックオフ（上限30秒）にジッタを足す"""
+    ra = resp.headers.get("Retry-After") if resp is not None else None
+    if ra:
+        try:
+            return float(ra) + random.uniform(0, 1)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time()) + random.uniform(0, 1)
+            except (TypeError, ValueError):
+                pass
+    return min(30.0, 2.0 ** attempt) + random.uniform(0, 1)
+
+def get_json(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """キャッシュ優先。ミス時はレート制御＋429/5xx/接続エラー時のリトライ付き GET"""
+    cached = CACHE.get(url, params)
+    if cached is not None:
+        return cached
+    for attempt in range(MAX_RETRIES + 1):
+        LIMITER.acquire()
+        try:
+            r = get_session().get(url, params=params, timeout=25)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(None, attempt))
+            continue
+        if r.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+            delay = backoff_delay(r, attempt)
+            if r.status_code == 429:
+                LIMITER.on_throttle(delay)  # 全スレッドをまとめて止める
+            else:
+                time.sleep(delay)
+            continue
+        r.raise_for_status()
+        LIMITER.on_success(r.headers)
+        data = loads_json(r.content)
+        CACHE.put(url, params, r.content)
+        return data
 
 def search_apps(term: str, country: str, lang: str, limit: int) -> List[Dict[str, Any]]:
     params = {
@@ -27,19 +178,35 @@ def search_apps(term: str, country: str, lang: str, limit: int) -> List[Dict[str
         "limit": limit,
         "media": "software",
     }
-    r = requests.get(ITUNES_SEARCH, params=params, headers=DEFAULT_HEADERS, timeout=25)
-    r.raise_for_status()
-    data = r.json()
+    data = get_json(ITUNES_SEARCH, params)
     return data.get("results", [])
 
-def lookup(track_id: int, country: str, lang: str) -> Optional[Dict[str, Any]]:
-    params = {"id": track_id, "entity": "software", "country": country, "lang": lang}
-    r = requests.get(ITUNES_LOOKUP, params=params, headers=DEFAULT_HEADERS, timeout=25)
-    r.raise_for_status()
-    data = r.json()
-    if data.get("resultCount", 0) == 0:
-        return None
-    return data["results"][0]
+def search_slim(term: str, country: str, lang: str, limit: int) -> List[Dict[str, Any]]:
+    """search_apps の結果を SEARCH_FIELDS だけに絞る（検索結果は複数行で共有して持つので軽くしておく）"""
+    return [{k: r[k] for k in SEARCH_FIELDS if k in r} for r in search_apps(term, country, lang, limit)]
+
+def lookup_many(track_ids: List[int], country: str, lang: str) -> Dict[int, Dict[str, Any]]:
+    """複数 trackId をカンマ区切りでまとめて lookup（1リクエスト、trackId→レコード）"""
+    params = {"id": ",".join(map(str, track_ids)), "entity": "software", "country": country, "lang": lang}
+    data = get_json(ITUNES_LOOKUP, params)
+    return {r["trackId"]: r for r in data.get("results", []) if r.get("trackId")}
+
+def lookup_finals(track_ids: List[int], country_langs: List[Tuple[str, str]]) -> Dict[int, Dict[str, Any]]:
+    """trackId 群を国の順に lookup し、bundleId が取れた最初の国のレコードを返す（取れなかった ID は含まない）"""
+    finals: Dict[int, Dict[str, Any]] = {}
+    for country, lang in country_langs:
+        todo = [t for t in track_ids if t not in finals]
+        if not todo:
+            break
+        try:
+            looked = lookup_many(todo, country, lang)
+        except Exception as e:
+            print(f"[WARN] lookup failed {country} ({len(todo)} ids): {e}")
+            continue
+        for tid, rec in looked.items():
+            if rec.get("bundleId"):
+                finals[tid] = rec
+    return finals
 
 def to_set(vals) -> set:
     if not vals: return set()
@@ -47,23 +214,39 @@ def to_set(vals) -> set:
         return {vals}
     return set([str(v) for v in vals if v])
 
+@lru_cache(maxsize=200_000)
 def norm(s: Optional[str]) -> str:
+    # 同じ候補名・販売元名・ヒントが国や行をまたいで何度も来るのでメモ化
     return (s or "").strip().lower()
 
+class NameMatcher:
+    """norm 済みのクエリ名＋別名を1本の正規表現にまとめ、候補名1回の走査で exact/startswith/contains を判定する"""
+    def __init__(self, qn: str, alns: List[str]):
+        self.words = frozenset([qn, *alns])
+        self._pat = re.compile("|".join(re.escape(w) for w in sorted(self.words, key=len, reverse=True)))
+
+    def match(self, tn: str) -> Tuple[bool, bool, bool]:
+        # search は最左一致を返すので、どれかの語が先頭一致するなら start()==0 になる
+        m = self._pat.search(tn)
+        return tn in self.words, m is not None and m.start() == 0, m is not None
+
 def score_candidate(
-    qname: str,
+    matcher: NameMatcher,
     cand: Dict[str, Any],
     match_modes: List[str],
-    aliases: List[str],
-    developer_hint: Optional[str],
-    bundle_hint: Optional[str],
-) -> Tuple[float, Dict[str, float]]:
-    """候補スコア計算（詳細内訳も返す）"""
+    dev_hint_norm: Optional[str],
+    bundle_hint_norm: Optional[str],
+    fuzzy_score: Optional[int] = None,
+    dev_fuzzy_score: Optional[int] = None,
+) -> Tuple[int, Dict[str, int]]:
+    """候補スコア計算（詳細内訳も返す）。ファジー値は 0-100 なので加点も含め全て整数で扱う。
+    matcher は行ごとに1回だけ作ってクエリ名・別名の一致判定に使う。
+    dev_hint_norm / bundle_hint_norm も行ごとに norm 済みの値（ヒント無しは None）。
+    fuzzy_score / dev_fuzzy_score は呼び出し側で行ごとに cdist で一括計算した値"""
     tname = cand.get("trackName") or ""
     seller = cand.get("sellerName") or cand.get("artistName") or ""
     bundle = cand.get("bundleId") or ""
     pgenre = cand.get("primaryGenreName") or ""
-    genres = set(cand.get("genres", []))
 
     # 1) 名前類似度
     name_scores = []
@@ -72,68 +255,218 @@ def score_candidate(
     def add_score(label, val):
         name_scores.append(val); details[label] = val
 
-    qn = norm(qname)
-    tn = norm(tname)
-    alns = [norm(a) for a in aliases if a]
+    is_exact, is_prefix, is_contained = matcher.match(norm(tname))
 
     if "exact" in match_modes:
-        exact = 100.0 if tn == qn or any(tn == a for a in alns) else 0.0
-        add_score("exact", exact)
+        add_score("exact", 100 if is_exact else 0)
 
     if "startswith" in match_modes:
-        ssw = 92.0 if (tn.startswith(qn) or any(tn.startswith(a) for a in alns)) else 0.0
-        add_score("startswith", ssw)
+        add_score("startswith", 92 if is_prefix else 0)
 
     if "contains" in match_modes:
-        cont = 88.0 if (qn in tn or any(a in tn for a in alns)) else 0.0
-        add_score("contains", cont)
+        add_score("contains", 88 if is_contained else 0)
 
     if "fuzzy" in match_modes:
-        base = max(fuzz.WRatio(qname, tname), *(fuzz.WRatio(a, tname) for a in alns)) if alns else fuzz.WRatio(qname, tname)
-        add_score("fuzzy", float(base))
+        add_score("fuzzy", int(fuzzy_score or 0))
 
-    name_score = max(name_scores) if name_scores else 0.0
+    name_score = max(name_scores) if name_scores else 0
 
     # 2) 開発元ヒント
-    dev_bonus = 0.0
-    if developer_hint:
-        if norm(developer_hint) in norm(seller):
-            dev_bonus = 8.0
+    dev_bonus = 0
+    if dev_hint_norm is not None:
+        sn = norm(seller)
+        if dev_hint_norm in sn:
+            dev_bonus = 8
         else:
             # 緩くファジー
-            dev_bonus = 4.0 if fuzz.partial_ratio(developer_hint, seller) >= 80 else 0.0
+            if dev_fuzzy_score is None:
+                dev_fuzzy_score = fuzz.partial_ratio(dev_hint_norm, sn)
+            dev_bonus = 4 if dev_fuzzy_score >= 80 else 0
     details["dev_bonus"] = dev_bonus
 
     # 3) バンドルIDヒント
-    bundle_bonus = 0.0
-    if bundle_hint:
-        if norm(bundle_hint) == norm(bundle):
-            bundle_bonus = 25.0
-        elif norm(bundle_hint) in norm(bundle):
-            bundle_bonus = 12.0
+    bundle_bonus = 0
+    if bundle_hint_norm is not None:
+        bn = norm(bundle)
+        if bundle_hint_norm == bn:
+            bundle_bonus = 25
+        elif bundle_hint_norm in bn:
+            bundle_bonus = 12
     details["bundle_bonus"] = bundle_bonus
 
     # 4) ジャンル重み（妊活系を仮に重み付け）
-    genre_bonus = 0.0
-    if pgenre in HEALTHY_GENRES or (HEALTHY_GENRES & genres):
-        genre_bonus = 3.0
+    genre_bonus = 0
+    if pgenre in HEALTHY_GENRES or any(g in HEALTHY_GENRES for g in cand.get("genres") or ()):
+        genre_bonus = 3
     details["genre_bonus"] = genre_bonus
 
     total = name_score + dev_bonus + bundle_bonus + genre_bonus
     details["total"] = total
     return total, details
 
-def pick_winner(scored: List[Tuple[Dict[str, Any], float, Dict[str, float]]], min_score: float, min_gap: float):
-    """スコア上位から自動確定するか判定"""
+def pick_winner(scored: List[Tuple[Dict[str, Any], int, Dict[str, int]]], totals: np.ndarray,
+                min_score: float, min_gap: float):
+    """スコア上位から自動確定するか判定。ranked は上位 REVIEW_TOP_N 件だけ。
+    totals は scored と同じ並びの合計点配列で、順位付けは numpy の安定ソート1回（同点は先に来た候補が上）"""
     if not scored:
         return None, []
-    ranked = sorted(scored, key=lambda x: x[1], reverse=True)
-    top = ranked[0]
-    if top[1] < min_score:
+    top_idx = np.argsort(-totals, kind="stable")[:REVIEW_TOP_N]
+    ranked = [scored[i] for i in top_idx]
+    top_total = totals[top_idx[0]]
+    if top_total < min_score:
         return None, ranked
-    if len(ranked) >= 2 and (top[1] - ranked[1][1]) < min_gap:
+    if len(top_idx) >= 2 and (top_total - totals[top_idx[1]]) < min_gap:
         return None, ranked
-    return top, ranked
+    return ranked[0], ranked
+
+def merge_candidates(futs: List[Tuple[str, Future]], qname: str) -> Dict[int, Dict[str, Any]]:
+    """国別の検索結果を集めて trackId ごとにまとめる（各レコードに見つかった国 _countries を付ける）。
+    futs は (大文字の国コード, 検索 Future) のリスト（別名検索がある場合は同じ国が複数回並ぶ）"""
+    candidates_by_id: Dict[int, Dict[str, Any]] = {}
+    for country, fut in futs:
+        try:
+            results = fut.result()
+        except Exception as e:
+            print(f"[WARN] search failed {country} {qname}: {e}")
+            results = []
+
+        for rec in results:
+            tid = rec.get("trackId")
+            if not tid:
+                continue
+            # 代表（最初の国の結果）を基本に、国を記録
+            if tid not in candidates_by_id:
+                candidates_by_id[tid] = rec.copy()
+                candidates_by_id[tid]["_countries"] = {country}
+            else:
+                candidates_by_id[tid]["_countries"].add(country)
+    return candidates_by_id
+
+def score_row(
+    row: Dict[str, Any],
+    candidates_by_id: Dict[int, Dict[str, Any]],
+    match_modes: List[str],
+    min_score: float,
+    min_gap: float,
+    fuzzy_cutoff: int,
+    cdist_workers: int = -1,
+    fuzzy_scorer: str = "wratio",
+):
+    """1行分の候補をスコアリングして勝者判定まで行う（プロセスプールに渡せるようトップレベルに置く）。
+    戻り値: (勝者 (app_key, query_name, rec, total, details) か None, needs_review 行, candidates_raw 行)"""
+    app_key = row["app_key"]
+    qname = row["query_name"]
+
+    # 正規化と一致判定用パターンの構築は候補ループの外で1回だけ
+    qn = norm(qname)
+    alns = [norm(a) for a in row["aliases"] if a]
+    matcher = NameMatcher(qn, alns)
+    # ヒントも候補ごとではなくここで1回だけ正規化（空ヒントは None = 判定しない）
+    dev_hint_norm = norm(row["developer_hint"]) if row["developer_hint"] else None
+    bundle_hint_norm = norm(row["bundle_hint"]) if row["bundle_hint"] else None
+
+    # ファジー類似度は [qname]+別名 × 全候補名 を1回の cdist でまとめて計算（候補ごとに最大値）
+    # fuzzy_cutoff 未満は 0 として早期打ち切り。スコアラーと processor は FUZZY_SCORERS から
+    fuzzy_scores = None
+    if "fuzzy" in match_modes and candidates_by_id:
+        scorer, processor = FUZZY_SCORERS[fuzzy_scorer]
+        queries = [qn] + alns
+        choices = [norm(rec.get("trackName")) for rec in candidates_by_id.values()]
+        fuzzy_scores = process.cdist(
+            queries, choices, scorer=scorer, processor=processor,
+            score_cutoff=fuzzy_cutoff, dtype=np.uint8, workers=cdist_workers,
+        ).max(axis=0)
+
+    # 開発元ヒントの partial_ratio も全候補の販売元名に対して1回の cdist で（80未満は 0）
+    dev_scores = None
+    if dev_hint_norm is not None and candidates_by_id:
+        sellers = [norm(rec.get("sellerName") or rec.get("artistName")) for rec in candidates_by_id.values()]
+        dev_scores = process.cdist(
+            [dev_hint_norm], sellers, scorer=fuzz.partial_ratio, processor=None,
+            score_cutoff=80, dtype=np.uint8, workers=cdist_workers,
+        )[0]
+
+    # スコアリング
+    scored = []
+    cand_rows = []
+    totals = np.empty(len(candidates_by_id), dtype=np.int64)
+    for j, (tid, rec) in enumerate(candidates_by_id.items()):
+        total, details = score_candidate(
+            matcher, rec, match_modes, dev_hint_norm, bundle_hint_norm,
+            fuzzy_score=fuzzy_scores[j] if fuzzy_scores is not None else None,
+            dev_fuzzy_score=dev_scores[j] if dev_scores is not None else None,
+        )
+        scored.append((rec, total, details))
+        totals[j] = total
+        cand_rows.append({
+            "app_key": app_key,
+            "query_name": qname,
+            "trackId": tid,
+            "bundleId": rec.get("bundleId"),
+            "trackName": rec.get("trackName"),
+            "sellerName": rec.get("sellerName") or rec.get("artistName"),
+            "primaryGenreName": rec.get("primaryGenreName"),
+            "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
+            **details
+        })
+
+    winner, ranked = pick_winner(scored, totals, min_score, min_gap)
+
+    review_rows = []
+    if winner is None:
+        # 自動確定できない → needs_review
+        # 上位最大 REVIEW_TOP_N 件だけ書き出し
+        for rec, score, details in ranked:
+            review_rows.append({
+                "app_key": app_key,
+                "query_name": qname,
+                "trackId": rec.get("trackId"),
+                "bundleId": rec.get("bundleId"),
+                "trackName": rec.get("trackName"),
+                "sellerName": rec.get("sellerName") or rec.get("artistName"),
+                "primaryGenreName": rec.get("primaryGenreName"),
+                "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
+                "score_total": score,
+                "score_breakdown": dumps_json(details)
+            })
+        return None, review_rows, cand_rows
+
+    return (app_key, qname, *winner), review_rows, cand_rows
+
+def master_row(app_key: str, qname: str, rec: Dict[str, Any], total: int, details: Dict[str, int],
+               final: Dict[str, Any]) -> Dict[str, Any]:
+    """apps_master の1行。名前等は lookup 結果 final、見つかった国は検索レコード rec から"""
+    return {
+        "app_key": app_key,
+        "query_name": qname,
+        "trackId": final.get("trackId"),
+        "bundleId": final.get("bundleId"),
+        "trackName": final.get("trackName"),
+        "sellerName": final.get("sellerName") or final.get("artistName"),
+        "primaryGenreName": final.get("primaryGenreName"),
+        "languageCodesISO2A": ";".join(final.get("languageCodesISO2A", [])),
+        "releaseDate": final.get("releaseDate"),
+        "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
+        "score_total": total,
+        "score_breakdown": dumps_json(details)
+    }
+
+def map_in_order(pool: Executor, fn, items, window: int):
+    """items を pool に投げ、投入順に結果を返す（同時に抱える未完了タスクは window 件まで）"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def open_csv_writer(stack: contextlib.ExitStack, path: Path, fieldnames: List[str]) -> csv.DictWriter:
+    """ヘッダを書いた DictWriter を返す（ファイルは stack が閉じる）"""
+    f = stack.enter_context(path.open("w", encoding="utf-8", newline=""))
+    w = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
+    w.writeheader()
+    return w
 
 def load_inputs(args) -> List[Dict[str, Any]]:
     rows = []
@@ -144,21 +477,26 @@ def load_inputs(args) -> List[Dict[str, Any]]:
                 if q:
                     rows.append({"app_key": q, "query_name": q, "developer_hint": "", "bundle_hint": "", "aliases": []})
     elif args.input_csv:
-        df = pd.read_csv(args.input_csv)
-        for _, r in df.iterrows():
-            aliases = []
-            for c in df.columns:
-                if str(c).lower().startswith("alias"):
-                    v = r[c]
-                    if isinstance(v, str) and v.strip():
-                        aliases.append(v.strip())
-            rows.append({
-                "app_key": str(r.get("app_key", r.get("query_name", ""))) or str(r.get("query_name", "")),
-                "query_name": str(r.get("query_name", "")),
-                "developer_hint": str(r.get("developer_hint", "")) if not pd.isna(r.get("developer_hint", "")) else "",
-                "bundle_hint": str(r.get("bundle_hint", "")) if not pd.isna(r.get("bundle_hint", "")) else "",
-                "aliases": aliases
-            })
+        # 全列を文字列で読み、欠損は空文字のまま（行ごとの isna 判定をしない）
+        df = pd.read_csv(args.input_csv, dtype=str, keep_default_na=False)
+        alias_cols = [c for c in df.columns if str(c).lower().startswith("alias")]
+        blank = [""] * len(df)
+
+        def col(name: str) -> List[str]:
+            return df[name].tolist() if name in df.columns else blank
+
+        qnames = col("query_name")
+        alias_lists = df[alias_cols].values.tolist() if alias_cols else [[] for _ in qnames]
+        rows = [
+            {
+                "app_key": k or q,
+                "query_name": q,
+                "developer_hint": d,
+                "bundle_hint": b,
+                "aliases": [a.strip() for a in als if a.strip()],
+            }
+            for k, q, d, b, als in zip(col("app_key"), qnames, col("developer_hint"), col("bundle_hint"), alias_lists)
+        ]
     else:
         raise ValueError("Provide --input-names or --input-csv")
     return rows
@@ -171,8 +509,16 @@ def main():
     ap.add_argument("--countries", nargs="+", default=["gb","jp"])
     ap.add_argument("--lang-map", default="gb=en_us,jp=ja_jp")
     ap.add_argument("--limit-per-country", type=int, default=25)
-    ap.add_argument("--sleep", type=float, default=0.4)
+    ap.add_argument("--sleep", type=float, default=0.4, help="API呼び出しの基準間隔（秒）。レートリミッタの基準レート=1/sleep")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="iTunes応答のキャッシュ先")
+    ap.add_argument("--cache-ttl", type=float, default=86400, help="キャッシュ有効秒数（0以下でキャッシュ無効）")
+    ap.add_argument("--no-cache", action="store_true", help="この実行ではキャッシュを読みも書きもしない（常に API を叩く）")
+    ap.add_argument("--workers", type=int, default=8, help="iTunes API を並列に叩くスレッド数")
+    ap.add_argument("--score-procs", type=int, default=0, help="スコアリング用プロセス数（0=メインプロセスで実行）")
+    ap.add_argument("--search-aliases", action="store_true", help="query_name に加えて別名でも検索する（同じ語の検索は1回にまとめる）")
     ap.add_argument("--match-mode", nargs="+", default=["startswith","contains","fuzzy"])  # exact/startswith/contains/fuzzy
+    ap.add_argument("--fuzzy-scorer", choices=sorted(FUZZY_SCORERS), default="wratio",
+                    help="fuzzy の類似度関数（wratio=WRatio, token_set=token_set_ratio。token_set は完全一致と派生名が同点になりやすい）")
     ap.add_argument("--min-score", type=float, default=80.0)
     ap.add_argument("--min-gap", type=float, default=8.0)
     args = ap.parse_args()
@@ -187,125 +533,129 @@ def main():
             lang_map[c.strip().lower()] = l.strip()
     for c in args.countries:
         lang_map.setdefault(c.lower(), "en_us")
+    # (大文字, 小文字, lang) を先に作っておき、行×国のループで lower()/辞書引きを繰り返さない
+    country_specs = [(c.upper(), c.lower(), lang_map[c.lower()]) for c in args.countries]
 
     rows = load_inputs(args)
+    LIMITER.set_rate(1.0 / args.sleep if args.sleep > 0 else 1000.0)
+    CACHE.root, CACHE.ttl = Path(args.cache_dir), (0 if args.no_cache else args.cache_ttl)
 
-    master_rows = []       # 確定ID台帳
-    needs_review_rows = [] # あいまい案件
-    cand_rows = []         # 監査用全候補
+    # ファジー値がこれ未満の候補は加点を全部足しても min_score - min_gap に届かず、
+    # 勝者判定にもギャップ判定にも影響しない
+    fuzzy_cutoff = max(0, int(args.min_score - args.min_gap - MAX_BONUS))
 
     # trackIdで重複を統一
     existing_track_ids = set()
 
-    for row in tqdm(rows, desc="Resolve"):
-        app_key = row["app_key"]
-        qname = row["query_name"]
-        dev_hint = row["developer_hint"]
-        bundle_hint = row["bundle_hint"]
-        aliases = row["aliases"]
-
-        # 国横断で候補収集（trackId重複はまとめる）
-        candidates_by_id: Dict[int, Dict[str, Any]] = {}
-
-        for country in args.countries:
-            lang = lang_map[country.lower()]
-            try:
-                results = search_apps(qname, country, lang, args.limit_per_country)
-            except Exception as e:
-                print(f"[WARN] search failed {country} {qname}: {e}")
-                results = []
-
-            for rec in results:
-                tid = rec.get("trackId")
-                if not tid:
-                    continue
-                # 代表（最初の国の結果）を基本に、国を記録
-                if tid not in candidates_by_id:
-                    candidates_by_id[tid] = rec.copy()
-                    candidates_by_id[tid]["_countries"] = {country.upper()}
-                else:
-                    candidates_by_id[tid]["_countries"].add(country.upper())
-
-            time.sleep(args.sleep)
-
-        # スコアリング
-        scored = []
-        for tid, rec in candidates_by_id.items():
-            total, details = score_candidate(
-                qname, rec, args.match_mode, aliases, dev_hint, bundle_hint
-            )
-            scored.append((rec, total, details))
-            cand_rows.append({
-                "app_key": app_key,
-                "query_name": qname,
-                "trackId": tid,
-                "bundleId": rec.get("bundleId"),
-                "trackName": rec.get("trackName"),
-                "sellerName": rec.get("sellerName") or rec.get("artistName"),
-                "primaryGenreName": rec.get("primaryGenreName"),
-                "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
-                **details
-            })
-
-        winner, ranked = pick_winner(scored, args.min_score, args.min_gap)
-
-        if winner is None:
-            # 自動確定できない → needs_review
-            # 上位最大5件だけ書き出し
-            for rec, score, details in ranked[:5]:
-                needs_review_rows.append({
-                    "app_key": app_key,
-                    "query_name": qname,
-                    "trackId": rec.get("trackId"),
-                    "bundleId": rec.get("bundleId"),
-                    "trackName": rec.get("trackName"),
-                    "sellerName": rec.get("sellerName") or rec.get("artistName"),
-                    "primaryGenreName": rec.get("primaryGenreName"),
-                    "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
-                    "score_total": score,
-                    "score_breakdown": json.dumps(details, ensure_ascii=False)
-                })
-            continue
-
-        # 勝者（自動確定）
-        rec, total, details = winner
-        track_id = rec.get("trackId")
-        if track_id in existing_track_ids:
-            # すでに登録済みならスキップ（別名で同じアプリを指していたケース）
-            continue
-        existing_track_ids.add(track_id)
-
-        # 代表国で lookup して bundleIdや名前を最終確定（失敗しても検索結果を使う）
-        final = rec
-        for country in args.countries:
-            try:
-                looked = lookup(track_id, country, lang_map[country.lower()])
-                if looked and looked.get("bundleId"):
-                    final = looked
-                    break
-            except Exception:
-                pass
-            time.sleep(args.sleep)
-
-        master_rows.append({
-            "app_key": app_key,
-            "query_name": qname,
-            "trackId": final.get("trackId"),
-            "bundleId": final.get("bundleId"),
-            "trackName": final.get("trackName"),
-            "sellerName": final.get("sellerName") or final.get("artistName"),
-            "primaryGenreName": final.get("primaryGenreName"),
-            "languageCodesISO2A": ";".join(final.get("languageCodesISO2A", [])),
-            "releaseDate": final.get("releaseDate"),
-            "countries_found": ";".join(sorted(list(rec.get("_countries", set())))),
-            "score_total": total,
-            "score_breakdown": json.dumps(details, ensure_ascii=False)
-        })
-
-    # 保存
-    pd.DataFrame(master_rows).to_csv(outdir / "apps_master.csv", index=False, quoting=csv.QUOTE_MINIMAL)
-    pd.DataFrame(needs_review_rows).to_csv(outdir / "needs_review.csv", index=False, quoting=csv.QUOTE_MINIMAL)
-    pd.DataFrame(cand_rows).to_csv(outdir / "candidates_raw.csv", index=False, quoting=csv.QUOTE_MINIMAL)
+    with contextlib.ExitStack() as stack:
+        # 行ごとに逐次書き出す（全行をメモリに溜めない）
+        master_w = open_csv_writer(stack, outdir / "apps_master.csv", MASTER_COLS)   # 確定ID台帳
+        review_w = open_csv_writer(stack, outdir / "needs_review.csv", REVIEW_COLS)  # あいまい案件
+        cand_cols = ROW_COLS + ["countries_found"] + [m for m in MATCH_MODES if m in args.match_mode] + BONUS_COLS
+        cand_w = open_csv_writer(stack, outdir / "candidates_raw.csv", cand_cols)    # 監査用全候補
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=args.workers))
+        # 検索は先読み分を pool へ積み続けるので、lookup は別プールで検索と並行して流す（レートは LIMITER で共通）
+        lookup_pool = stack.enter_context(ThreadPoolExecutor(max_workers=LOOKUP_WORKERS))
+        country_langs = [(cl, lang) for _, cl, lang in country_specs]
+        # lookup 済みになった分から順に apps_master へ書く（投入順を保つ）
+        # 各要素は (lookup Future, そのバッチの勝者 (app_key, query_name, 検索レコード, total, details) 群)
+        lookup_futs: deque = deque()
+        pending: List[Tuple[Any, ...]] = []
+
+        def flush_masters(block: bool):
+            while lookup_futs and (block or lookup_futs[0][0].done()):
+                fut, batch = lookup_futs.popleft()
+                finals = fut.result()
+                master_w.writerows(master_row(*w, finals.get(w[2]["trackId"], w[2])) for w in batch)
+
+        def submit_lookup():
+            # 検索レコードに最終フィールドがそろっている勝者は lookup せず、そのまま master に使う
+            ids = [w[2]["trackId"] for w in pending if not all(w[2].get(k) for k in FINAL_FIELDS)]
+            if ids:
+                fut = lookup_pool.submit(lookup_finals, ids, country_langs)
+            else:
+                fut = Future()
+                fut.set_result({})
+            lookup_futs.append((fut, pending))
+
+        def row_terms(row: Dict[str, Any]) -> List[str]:
+            # --search-aliases なら別名も検索語に足す（行内の重複は除き、行をまたぐ重複は search_memo で1回に）
+            if not args.search_aliases:
+                return [row["query_name"]]
+            return list(dict.fromkeys([row["query_name"], *row["aliases"]]))
+
+        # 各行の検索キー (大文字の国, (term, country, lang, limit))。キーは文字列だけなので全行分作っておける
+        row_keys = [
+            [(cu, (term, cl, lang, args.limit_per_country)) for cu, cl, lang in country_specs for term in row_terms(row)]
+            for row in rows
+        ]
+        # 同じキーの検索は1回だけ投げて結果を共有する。残りの利用回数を数え、最後に使う行が済んだら memo から捨てる
+        uses = Counter(key for keys in row_keys for _, key in keys)
+        search_memo: Dict[Tuple[str, str, str, int], Future] = {}
+
+        def submit_row(i: int) -> List[Tuple[str, Future]]:
+            futs = []
+            for cu, key in row_keys[i]:
+                if key not in search_memo:
+                    search_memo[key] = pool.submit(search_slim, *key)
+                futs.append((cu, search_memo[key]))
+            return futs
+
+        def release_row(i: int):
+            for _, key in row_keys[i]:
+                uses[key] -= 1
+                if uses[key] == 0:
+                    del search_memo[key]
+
+        def merged_rows():
+            # 検索は先読み窓（--workers × SEARCH_AHEAD 行）の分だけ投入し、1行消費するごとに1行足す。
+            # HTTP待ちは重ねつつ、全行の検索結果を実行終了まで抱えない（結果は行順に返す）
+            ahead = iter(range(len(rows)))
+            window = deque((i, submit_row(i)) for i in islice(ahead, args.workers * SEARCH_AHEAD))
+            while window:
+                i, futs = window.popleft()
+                candidates_by_id = merge_candidates(futs, rows[i]["query_name"])
+                release_row(i)
+                window.extend((j, submit_row(j)) for j in islice(ahead, 1))
+                yield rows[i], candidates_by_id
+
+        # 検索結果がそろった行から順にスコアリング（--score-procs>0 ならプロセスプールで並列）
+        cdist_workers = 1 if args.score_procs > 0 else -1
+        items = (
+            (row, candidates_by_id, args.match_mode, args.min_score, args.min_gap,
+             fuzzy_cutoff, cdist_workers, args.fuzzy_scorer)
+            for row, candidates_by_id in merged_rows()
+        )
+        if args.score_procs > 0:
+            score_pool = stack.enter_context(ProcessPoolExecutor(max_workers=args.score_procs))
+            results = map_in_order(score_pool, score_row, items, window=args.score_procs * 4)
+        else:
+            results = (score_row(*item) for item in items)
+
+        for winner, review_rows, cand_rows in tqdm(results, total=len(rows), desc="Resolve"):
+            cand_w.writerows(cand_rows)
+            review_w.writerows(review_rows)
+            if winner is None:
+                continue
+
+            # 勝者（自動確定）
+            track_id = winner[2].get("trackId")
+            if track_id in existing_track_ids:
+                # すでに登録済みならスキップ（別名で同じアプリを指していたケース）
+                continue
+            existing_track_ids.add(track_id)
+
+            # 代表国で lookup して bundleIdや名前を最終確定（失敗・不要なら検索結果を使う）
+            # LOOKUP_BATCH 件たまるごとにまとめて投げ、残りの行の検索・スコアリングと重ねる
+            pending.append(winner)
+            if len(pending) >= LOOKUP_BATCH:
+                submit_lookup()
+                pending = []
+            flush_masters(block=False)
+
+        if pending:
+            submit_lookup()
+        flush_masters(block=True)
 
     print(f"Saved: {outdir/'apps_master.csv'}")
     print(f"Saved: {outdir/'needs_review.csv'}  (manual check)")
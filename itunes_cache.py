@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""appstore_resolver.py / appstore_collect.py 共通の iTunes 応答キャッシュと JSON ヘルパー"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+try:
+    import orjson
+except ImportError:  # 無ければ標準の json で代用
+    orjson = None
+
+# 既定のキャッシュ先（キーは URL+params のハッシュなので両スクリプトで共有して問題ない）
+DEFAULT_CACHE_DIR = ".itunes_cache"
+
+def loads_json(b: bytes) -> Any:
+    return orjson.loads(b) if orjson else json.loads(b)
+
+def dumps_json(obj: Any) -> str:
+    return orjson.dumps(obj).decode("utf-8") if orjson else json.dumps(obj, ensure_ascii=False)
+
+class JsonCache:
+    """(URL, params) をキーに iTunes の生JSON応答をファイル保存する。ttl秒で失効、ttl<=0 で無効"""
+    def __init__(self, root: Path, ttl: float):
+        self.root = root
+        self.ttl = ttl
+
+    def _path(self, url: str, params: Dict[str, Any]) -> Path:
+        key = url + "?" + json.dumps(sorted(params.items()), ensure_ascii=False)
+        return self.root / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.ttl <= 0:
+            return None
+        p = self._path(url, params)
+        try:
+            if time.time() - p.stat().st_mtime > self.ttl:
+                return None
+            return loads_json(p.read_bytes())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, params: Dict[str, Any], content: bytes):
+        if self.ttl <= 0:
+            return
+        p = self._path(url, params)
+        tmp = p.with_name(f"{p.name}.{threading.get_ident()}.tmp")
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(content)
+            os.replace(tmp, p)
+        except OSError as e:
+            print(f"[WARN] cache write failed {p}: {e}")
@@ -9,6 +9,12 @@ import pandas as pd
 SRC = Path("out_resolve/apps_master.csv")
 DST = Path("ids_simple.csv")
 
+# fallback_linewise 用（呼び出しごとではなく import 時に1回だけコンパイル）
+TRACK_RE  = re.compile(r"\btrackId\b[^0-9]{0,10}(\d{6,12})", re.IGNORECASE)
+BUNDLE_RE = re.compile(r"\bbundleId\b[^A-Za-z0-9._-]{0,10}([A-Za-z0-9._-]+)", re.IGNORECASE)
+APPKEY_RE = re.compile(r"\bapp_key\b[^A-Za-z0-9._-]{0,10}([^\s,;]+)", re.IGNORECASE)
+QNAME_RE  = re.compile(r"\bquery_name\b[^A-Za-z0-9._-]{0,10}(.+)$", re.IGNORECASE)
+
 def read_df_loose(path: Path) -> pd.DataFrame:
     # まずはCSV（区切り自動判定）を寛容に読む
     try:
@@ -44,67 +50,56 @@ def normalize_ids(df: pd.DataFrame) -> pd.DataFrame:
     if not col_track and not col_bundle:
         raise ValueError(f"No trackId/bundleId columns found. Columns={list(df.columns)}")
 
-    out_rows = []
-    for _, r in df.iterrows():
-        track_raw  = (r.get(col_track)  if col_track  else "") or ""
-        bundle_raw = (r.get(col_bundle) if col_bundle else "") or ""
-        app_key    = ((r.get(col_appkey) or "").strip() if col_appkey else "") or None
-        query_name = ((r.get(col_qname)  or "").strip() if col_qname  else "") or None
-
-        track_raw = str(track_raw).strip()
-        bundle_raw = str(bundle_raw).strip()
-
-        track_id = None
-        if track_raw:
-            # "123456789.0" 対策＆余計な文字の除去
-            m = re.search(r"(\d{6,12})", track_raw)
-            if m:
-                try:
-                    track_id = int(m.group(1))
-                except Exception:
-                    track_id = None
+    # 行ループせず列単位で処理（無い列は空文字の列として扱う）
+    blank = pd.Series("", index=df.index, dtype=object)
 
-        if not track_id and not bundle_raw:
-            continue
+    def col(name):
+        return df[name].fillna("").astype(str).str.strip() if name else blank
 
-        out_rows.append({
-            "app_key": app_key,
-            "query_name": query_name,
-            "trackId": track_id,
-            "bundleId": bundle_raw or None
-        })
+    def none_if_blank(s: pd.Series) -> pd.Series:
+        return s.where(s.ne(""), None)
 
-    return pd.DataFrame(out_rows)
+    # "123456789.0" 対策＆余計な文字の除去
+    track = pd.to_numeric(col(col_track).str.extract(r"(\d{6,12})", expand=False), errors="coerce").astype("Int64")
+    bundle = col(col_bundle)
+    keep = track.notna() | bundle.ne("")
+
+    out = pd.DataFrame({
+        "app_key": none_if_blank(col(col_appkey)),
+        "query_name": none_if_blank(col(col_qname)),
+        "trackId": track,
+        "bundleId": none_if_blank(bundle),
+    })
+    return out[keep].reset_index(drop=True)
 
 def fallback_linewise(path: Path) -> pd.DataFrame:
     # 最終手段：ヘッダが壊れていても、行テキストから trackId / bundleId を抽出
     rows = []
-    track_re  = re.compile(r"\btrackId\b[^0-9]{0,10}(\d{6,12})", re.IGNORECASE)
-    bundle_re = re.compile(r"\bbundleId\b[^A-Za-z0-9._-]{0,10}([A-Za-z0-9._-]+)", re.IGNORECASE)
-    appkey_re = re.compile(r"\bapp_key\b[^A-Za-z0-9._-]{0,10}([^\s,;]+)", re.IGNORECASE)
-    qname_re  = re.compile(r"\bquery_name\b[^A-Za-z0-9._-]{0,10}(.+)$", re.IGNORECASE)
-
     with path.open("r", encoding="utf-8", errors="replace") as f:
         for line in f:
+            # trackId/bundleId の語を含まない行は正規表現に掛けずに捨てる
+            low = line.lower()
+            if "trackid" not in low and "bundleid" not in low:
+                continue
             t = None
             b = None
-            m1 = track_re.search(line)
+            m1 = TRACK_RE.search(line)
             if m1:
                 try:
                     t = int(m1.group(1))
                 except Exception:
                     t = None
-            m2 = bundle_re.search(line)
+            m2 = BUNDLE_RE.search(line)
             if m2:
                 b = m2.group(1).strip()
             if not t and not b:
                 continue
             app_key = None
             query_name = None
-            m3 = appkey_re.search(line)
+            m3 = APPKEY_RE.search(line)
             if m3:
                 app_key = m3.group(1).strip()
-            m4 = qname_re.search(line)
+            m4 = QNAME_RE.search(line)
             if m4:
                 query_name = m4.group(1).strip().strip('"')
             rows.append({"app_key": app_key, "query_name": query_name, "trackId": t, "bundleId": b or None})
@@ -122,10 +117,13 @@ def main():
         print("[ERROR] Could not extract any IDs. Please inspect the file around the reported bad lines.")
         sys.exit(1)
 
-    # 重複除去（trackId優先）
-    ids["trackId_str"] = ids["trackId"].apply(lambda x: str(int(x)) if pd.notna(x) and str(x).isdigit() else "")
-    ids["bundleId_str"] = ids["bundleId"].fillna("")
-    ids = ids.drop_duplicates(subset=["trackId_str", "bundleId_str"]).drop(columns=["trackId_str","bundleId_str"])
+    # 重複除去（trackId優先）。trackId は文字列化せず Int64 のまま、欠損は -1 をキーにする
+    ids["trackId"] = pd.to_numeric(ids["trackId"], errors="coerce").astype("Int64")
+    dup = pd.DataFrame({
+        "t": ids["trackId"].fillna(-1).astype("int64"),
+        "b": ids["bundleId"].fillna(""),
+    }).duplicated()
+    ids = ids[~dup.to_numpy()]
 
     ids.to_csv(DST, index=False)
     print(f"Wrote {DST} with {len(ids)} rows.")
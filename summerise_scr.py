@@ -9,39 +9,52 @@
 
 import argparse
 import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, Iterator, List, Tuple, Optional
+import numpy as np
 import pandas as pd
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+SCAN_WORKERS = 16  # ディレクトリ走査のスレッド数（readdir/stat の待ちを重ねる）
+
+def _is_image(entry: os.DirEntry) -> bool:
+    return entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS
+
+def _scan(d: str) -> List[os.DirEntry]:
+    try:
+        with os.scandir(d) as it:
+            return list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+def iter_files(root: str) -> Iterator[os.DirEntry]:
+    """rglob の代わり。スタックで scandir をたどり、ファイルの DirEntry だけ返す（Path を作らない）"""
+    stack = [root]
+    while stack:
+        for e in _scan(stack.pop()):
+            if e.is_dir(follow_symlinks=False):
+                stack.append(e.path)
+            else:
+                yield e
 
 def count_images_in_dir(d: Path) -> int:
-    if not d.exists() or not d.is_dir():
-        return 0
-    cnt = 0
-    for p in d.rglob("*"):
-        if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-            cnt += 1
-    return cnt
+    return sum(1 for e in iter_files(str(d)) if _is_image(e))
 
 def split_device_counts(track_dir: Path) -> Dict[str, int]:
     """iphone/ipad/appletv サブフォルダがある想定（なければ直下をiphone扱いしないで total にのみ加算）。"""
     counts = {"iphone": 0, "ipad": 0, "appletv": 0, "total": 0}
-    if not track_dir.exists():
+    entries = _scan(str(track_dir))
+    if not entries:
         return counts
 
     # サブフォルダ別
     for sub in ["iphone", "ipad", "appletv"]:
-        cdir = track_dir / sub
-        if cdir.exists():
-            c = sum(1 for p in cdir.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_EXTS)
-            counts[sub] = c
+        counts[sub] = count_images_in_dir(track_dir / sub)
 
     # サブフォルダ以外にも画像があるかも（後方互換）
-    other = 0
-    for p in track_dir.iterdir():
-        if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-            other += 1
+    other = sum(1 for e in entries if _is_image(e))
 
     counts["total"] = counts["iphone"] + counts["ipad"] + counts["appletv"] + other
     return counts
@@ -53,14 +66,8 @@ def read_metadata(meta_path: Path) -> pd.DataFrame:
     for col in ["trackId", "app_key", "trackName", "sellerName", "country"]:
         if col not in df.columns:
             df[col] = ""
-    # trackId を整数文字列に正規化
-    def norm_tid(x: str) -> str:
-        x = (x or "").strip()
-        # "123456789.0" のような形もあるかも
-        if x.endswith(".0"):
-            x = x[:-2]
-        return x
-    df["trackId_norm"] = df["trackId"].apply(norm_tid)
+    # trackId を整数文字列に正規化（"123456789.0" のような形もあるかも）
+    df["trackId_norm"] = df["trackId"].str.strip().str.removesuffix(".0")
     return df
 
 def main():
@@ -76,68 +83,73 @@ def main():
 
     # trackId -> 名前等のマップ（国に依らず代表1個を採用）
     # app_key はあれば採用。無ければ空。
-    id_to_name: Dict[str, Dict[str, str]] = {}
-    for _, r in meta_df.iterrows():
-        tid = r["trackId_norm"]
-        if not tid:
-            continue
-        if tid not in id_to_name:
-            id_to_name[tid] = {
-                "app_key": r.get("app_key", ""),
-                "trackName": r.get("trackName", ""),
-                "sellerName": r.get("sellerName", "")
-            }
+    id_to_name: Dict[str, Dict[str, str]] = (
+        meta_df[meta_df["trackId_norm"] != ""]
+        .drop_duplicates("trackId_norm", keep="first")
+        .set_index("trackId_norm")[["app_key", "trackName", "sellerName"]]
+        .to_dict(orient="index")
+    )
 
     # スクショ有の trackId を国別に収集
     per_country_track_ids: Dict[str, Dict[str, Dict[str, int]]] = {}  # country -> trackId -> device_counts
+    track_dirs: List[Tuple[str, str, Path]] = []  # (country, trackId, dir)
     for c in args.countries:
-        cdir = ss_root / c.lower()
         per_country_track_ids[c.lower()] = {}
-        if not cdir.exists():
-            continue
         # 直下の trackId ディレクトリを列挙
-        for track_dir in cdir.iterdir():
-            if not track_dir.is_dir():
+        for e in _scan(str(ss_root / c.lower())):
+            if not e.is_dir():
                 continue
-            tid = track_dir.name.strip()
+            tid = e.name.strip()
             # 数字のみのフォルダ名を優先的に扱う（念のため非数値も許容）
             # if not tid.isdigit():  # 必要なら有効化
             #     continue
-            counts = split_device_counts(track_dir)
+            track_dirs.append((c.lower(), tid, Path(e.path)))
+
+    # trackId ディレクトリごとの集計はスレッドプールで並列に（I/O 待ちが主なので GIL は問題にならない）
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
+        all_counts = ex.map(split_device_counts, [d for _, _, d in track_dirs])
+        for (c_low, tid, _), counts in zip(track_dirs, all_counts):
             if counts["total"] > 0:
-                per_country_track_ids[c.lower()][tid] = counts
+                per_country_track_ids[c_low][tid] = counts
 
     # すべての国の trackId を統合
     all_tids = set()
     for c in args.countries:
         all_tids |= set(per_country_track_ids.get(c.lower(), {}).keys())
 
-    rows: List[Dict[str, Any]] = []
-    for tid in sorted(all_tids, key=lambda x: int(x) if x.isdigit() else x):
-        name_info = id_to_name.get(tid, {"app_key": "", "trackName": "", "sellerName": ""})
-        row = {
-            "trackId": tid,
-            "app_key": name_info.get("app_key", ""),
-            "trackName": name_info.get("trackName", ""),
-            "sellerName": name_info.get("sellerName", ""),
-        }
-        has_any = []
-        for c in args.countries:
-            c_low = c.lower()
-            counts = per_country_track_ids.get(c_low, {}).get(tid, {"iphone":0,"ipad":0,"appletv":0,"total":0})
-            row[f"{c_low}_total"] = counts["total"]
-            row[f"{c_low}_iphone"] = counts["iphone"]
-            row[f"{c_low}_ipad"] = counts["ipad"]
-            row[f"{c_low}_appletv"] = counts["appletv"]
-            row[f"has_{c_low}"] = bool(counts["total"] > 0)
-            row[f"path_{c_low}"] = str((ss_root / c_low / tid).resolve()) if counts["total"] > 0 else ""
-            if counts["total"] > 0:
-                has_any.append(c_low)
-        row["countries_with_screenshots"] = ";".join(has_any)
-        row["has_both"] = all(row.get(f"has_{c.lower()}") for c in args.countries)
-        rows.append(row)
-
-    out_df = pd.DataFrame(rows)
+    # 数字の trackId は数値順（numpy で一括ソート）、非数値のフォルダ名はその後ろに文字列順で
+    # 元の文字列を保つため値ではなく添字を並べ替える（先頭ゼロ付きの名前もそのまま使える）
+    num_tids = [t for t in all_tids if t.isdigit()]
+    order = np.argsort(np.fromiter((int(t) for t in num_tids), dtype=np.int64, count=len(num_tids)), kind="stable")
+    ordered_tids = [num_tids[i] for i in order] + sorted(t for t in all_tids if not t.isdigit())
+
+    def iter_rows() -> Iterator[Dict[str, Any]]:
+        for tid in ordered_tids:
+            name_info = id_to_name.get(tid, {"app_key": "", "trackName": "", "sellerName": ""})
+            row = {
+                "trackId": tid,
+                "app_key": name_info.get("app_key", ""),
+                "trackName": name_info.get("trackName", ""),
+                "sellerName": name_info.get("sellerName", ""),
+            }
+            has_any = []
+            for c in args.countries:
+                c_low = c.lower()
+                counts = per_country_track_ids.get(c_low, {}).get(tid, {"iphone":0,"ipad":0,"appletv":0,"total":0})
+                row[f"{c_low}_total"] = counts["total"]
+                row[f"{c_low}_iphone"] = counts["iphone"]
+                row[f"{c_low}_ipad"] = counts["ipad"]
+                row[f"{c_low}_appletv"] = counts["appletv"]
+                row[f"has_{c_low}"] = bool(counts["total"] > 0)
+                row[f"path_{c_low}"] = str((ss_root / c_low / tid).resolve()) if counts["total"] > 0 else ""
+                if counts["total"] > 0:
+                    has_any.append(c_low)
+            row["countries_with_screenshots"] = ";".join(has_any)
+            row["has_both"] = all(row.get(f"has_{c.lower()}") for c in args.countries)
+            yield row
+
+    # 行の組み立てはジェネレータで回す（from_records が内部で list 化するので行リスト分のメモリは一時的に要る）
+    out_df = pd.DataFrame.from_records(iter_rows())
 
     # 見やすい列順
     ordered_cols = ["trackId","app_key","trackName","sellerName"]
@@ -2,14 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Iterable, List, Tuple, Dict, Optional
 import pandas as pd
 from PIL import Image
 import streamlit as st
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
 DEVICE_DIRS = ["iphone", "ipad", "appletv"]
+DEVICE_SET = frozenset(DEVICE_DIRS)
+THUMB_SIDE = 512      # グリッド表示用サムネイルの長辺(px)
+THUMB_QUALITY = 85
+THUMB_WORKERS = 8     # サムネイル生成の並列数（PIL のデコード中は GIL が外れる）
 
 # ---------- helpers ----------
 
@@ -27,50 +35,108 @@ def load_csv(csv_path: str) -> pd.DataFrame:
     missing = need - set(df.columns)
     if missing:
         raise ValueError(f"CSVに必要な列が足りません: {missing}")
+    # 絞り込み用の列はここで1回だけ作る（操作のたびの再計算を避ける）
+    df["_has_gb"] = df["path_gb"].fillna("").astype(str).str.strip().ne("")
+    df["_has_jp"] = df["path_jp"].fillna("").astype(str).str.strip().ne("")
+    df["_name_lower"] = df["appName"].fillna("").astype(str).str.lower()
     # 表示用にソート
     return df.sort_values("appName").reset_index(drop=True)
 
-def list_images_under(root: Path) -> List[Path]:
-    """root配下から画像を再帰的に収集。存在しない場合は空"""
-    if not root or not root.exists():
-        return []
-    out: List[Path] = []
+def _walk_images(root: str) -> List[str]:
+    """rglob の代わり。スタックで scandir をたどり、画像ファイルのパス文字列だけ返す"""
+    out: List[str] = []
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                stack.append(e.path)
+            elif e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTS:
+                out.append(e.path)
+    return out
+
+def _dir_sig(root: Path) -> Tuple[int, ...]:
+    """キャッシュキー用。root と各デバイスフォルダの mtime_ns（無ければ 0）"""
+    sig = []
+    for d in [root] + [root / sub for sub in DEVICE_DIRS]:
+        try:
+            sig.append(d.stat().st_mtime_ns)
+        except OSError:
+            sig.append(0)
+    return tuple(sig)
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _list_images(root_str: str, mtime_sig: Tuple[int, ...]) -> List[str]:
+    out: List[str] = []
     # まずはデバイス別サブフォルダを優先的に走査
     for sub in DEVICE_DIRS:
-        d = root / sub
-        if d.exists():
-            for p in d.rglob("*"):
-                if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-                    out.append(p)
+        out.extend(_walk_images(os.path.join(root_str, sub)))
     # サブフォルダ外に直置きがあればそれも拾う
-    for p in root.iterdir() if root.exists() else []:
-        if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-            out.append(p)
+    try:
+        with os.scandir(root_str) as it:
+            out.extend(e.path for e in it
+                       if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTS)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
     # 重複排除＆安定ソート
-    out = sorted(list(dict.fromkeys(out)), key=lambda p: p.as_posix())
-    return out
+    return sorted(dict.fromkeys(out), key=lambda p: p.replace(os.sep, "/"))
+
+def list_images_under(root: Path) -> List[Path]:
+    """root配下から画像を再帰的に収集。存在しない場合は空"""
+    if not root or not root.exists():
+        return []
+    return [Path(p) for p in _list_images(str(root), _dir_sig(root))]
 
 def split_by_device(paths: List[Path]) -> Dict[str, List[Path]]:
+    # cache_data にするとキー計算でリスト全体を毎回ハッシュするので付けない（走査は _list_images 側でキャッシュ済み）
     buckets = {d: [] for d in DEVICE_DIRS}
     buckets["other"] = []
     for p in paths:
-        tagged = False
-        for d in DEVICE_DIRS:
-            if f"/{d}/" in p.as_posix() or p.parent.name.lower() == d:
-                buckets[d].append(p)
-                tagged = True
-                break
-        if not tagged:
-            buckets["other"].append(p)
+        # ほとんどは <device>/<file> 直下なので親フォルダ名の集合引き1回で済ませる
+        key = p.parent.name.lower()
+        if key not in DEVICE_SET:
+            # 深い階層に置かれた場合だけパス全体を見る
+            posix = p.as_posix()
+            key = next((d for d in DEVICE_DIRS if f"/{d}/" in posix), "other")
+        buckets[key].append(p)
     for k in buckets:
-        buckets[k] = sorted(buckets[k], key=lambda x: x.name)
+        buckets[k].sort(key=attrgetter("name"))
     return buckets
 
+@st.cache_data(show_spinner=False)
+def load_thumb(path: str, mtime: float, side: int = THUMB_SIDE) -> bytes:
+    """縮小済み JPEG のバイト列を返す。mtime をキーに含めるのでファイル更新時は作り直す"""
+    with Image.open(path) as img:
+        img.thumbnail((side, side), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")  # JPEG はアルファ非対応
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=THUMB_QUALITY)
+    return buf.getvalue()
+
+def thumb_of(p: Path) -> bytes:
+    return load_thumb(str(p), p.stat().st_mtime)
+
+@st.cache_resource(show_spinner=False)
+def thumb_pool() -> ThreadPoolExecutor:
+    # rerun ごとにスレッドを作り直さないようプロセスで1つだけ持つ
+    return ThreadPoolExecutor(max_workers=THUMB_WORKERS)
+
+def prefetch_thumbs(paths: Iterable[Path]) -> Dict[Path, Future]:
+    """表示予定の画像のサムネイル生成をまとめてスレッドプールに投げる（結果は load_thumb のキャッシュにも入る）"""
+    pool = thumb_pool()
+    return {p: pool.submit(thumb_of, p) for p in dict.fromkeys(paths)}
+
 def make_columns(n: int):
     n = max(1, min(n, 6))
     return st.columns(n, gap="small")
 
-def show_images_grid(paths: List[Path], max_per_block: int, ncols: int, caption_prefix: str):
+def show_images_grid(paths: List[Path], max_per_block: int, ncols: int, caption_prefix: str,
+                     thumbs: Optional[Dict[Path, Future]] = None):
     paths = paths[:max_per_block]
     if not paths:
         st.info("No images.")
@@ -79,8 +145,9 @@ def show_images_grid(paths: List[Path], max_per_block: int, ncols: int, caption_
     for i, p in enumerate(paths):
         with cols[i % ncols]:
             try:
-                img = Image.open(p)
-                st.image(img, caption=f"{caption_prefix}: {p.name}", use_container_width=True)
+                fut = thumbs.get(p) if thumbs else None
+                thumb = fut.result() if fut is not None else thumb_of(p)
+                st.image(thumb, caption=f"{caption_prefix}: {p.name}", use_container_width=True)
             except Exception as e:
                 st.warning(f"Failed to open: {p.name} ({e})")
 
@@ -118,14 +185,11 @@ def main():
         )
 
     # 絞り込み
-    view = df.copy()
+    view = df
     if q:
-        view = view[view["appName"].str.lower().str.contains(q)]
-    # パスの有無判定
-    def has_any(path_col):
-        return view[path_col].fillna("").str.strip().ne("")
+        view = view[view["_name_lower"].str.contains(q)]
     if only_both:
-        view = view[has_any("path_gb") & has_any("path_jp")]
+        view = view[view["_has_gb"] & view["_has_jp"]]
 
     if view.empty:
         st.warning("条件に合うアプリがありません。検索条件を緩めてください。")
@@ -141,6 +205,16 @@ def main():
     path_gb = coalesce_path(sel_row.get("path_gb"))
     path_jp = coalesce_path(sel_row.get("path_jp"))
 
+    # 表示する分（各デバイス先頭 max_per_device 枚）のサムネイルを先に並列で作らせておく
+    gb_split = split_by_device(list_images_under(path_gb)) if path_gb else {}
+    jp_split = split_by_device(list_images_under(path_jp)) if path_jp else {}
+    thumbs = prefetch_thumbs(
+        p
+        for split in (gb_split, jp_split)
+        for dev, imgs in split.items() if dev in device_filter
+        for p in imgs[:max_per_device]
+    )
+
     st.subheader(f"{sel_name}  (trackId: {track_id})")
     cols_top = st.columns(2, gap="large")
 
@@ -150,8 +224,6 @@ def main():
         if not path_gb:
             st.info("No GB screenshots.")
         else:
-            gb_all = list_images_under(path_gb)
-            gb_split = split_by_device(gb_all)
             total = sum(len(v) for v in gb_split.values())
             st.caption(f"Path: `{path_gb}` • {total} images")
             for dev in ["iphone","ipad","appletv","other"]:
@@ -160,7 +232,7 @@ def main():
                 imgs = gb_split.get(dev, [])
                 if imgs:
                     with st.expander(f"{dev} ({len(imgs)})", expanded=(dev=="iphone")):
-                        show_images_grid(imgs, max_per_device, ncols, caption_prefix=dev)
+                        show_images_grid(imgs, max_per_device, ncols, caption_prefix=dev, thumbs=thumbs)
 
     # 右: JP
     with cols_top[1]:
@@ -168,8 +240,6 @@ def main():
         if not path_jp:
             st.info("No JP screenshots.")
         else:
-            jp_all = list_images_under(path_jp)
-            jp_split = split_by_device(jp_all)
             total = sum(len(v) for v in jp_split.values())
             st.caption(f"Path: `{path_jp}` • {total} images")
             for dev in ["iphone","ipad","appletv","other"]:
@@ -178,7 +248,7 @@ def main():
                 imgs = jp_split.get(dev, [])
                 if imgs:
                     with st.expander(f"{dev} ({len(imgs)})", expanded=(dev=="iphone")):
-                        show_images_grid(imgs, max_per_device, ncols, caption_prefix=dev)
+                        show_images_grid(imgs, max_per_device, ncols, caption_prefix=dev, thumbs=thumbs)
 
     # 下部：切り替えしやすい簡易テーブル
     with st.expander("Show table"):